@@ -0,0 +1,293 @@
+import argparse
+import datetime
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import statistics
+import threading
+import time
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import psutil
+from src import SBFScraper
+from src.concurrency import AIMDController
+from src.export import export_towns
+from src.shard import export_shards
+
+logging.basicConfig(level=logging.WARNING)
+
+
+def sample_rss(stop: threading.Event, peak: list, interval: float = 0.5):
+    """
+    Records the peak RSS of this process and every child, e.g. chromedriver
+    and Chrome, until stop is set
+    """
+    process = psutil.Process()
+    while not stop.wait(interval):
+        total = 0
+        for proc in [process] + process.children(recursive=True):
+            try:
+                total += proc.memory_info().rss
+            except psutil.Error:
+                pass
+        peak[0] = max(peak[0], total)
+
+
+def benchmark(mode: str, n_workers: int, n_towns: int) -> dict:
+    """
+    Scrapes the first n_towns towns in the given mode without exporting
+
+    Returns
+    -------
+    dict
+        pages per second and peak RSS in MB
+    """
+    scraper = SBFScraper(mode=mode, n_workers=n_workers)
+    links = scraper.get_links()[:n_towns]
+    stop, peak = threading.Event(), [0]
+    sampler = threading.Thread(target=sample_rss, args=(stop, peak), daemon=True)
+    sampler.start()
+    tic = time.perf_counter()
+    units = sum(len(town) for town in scraper.iter_units(links))
+    elapsed = time.perf_counter() - tic
+    stop.set()
+    sampler.join()
+    scraper._driver.quit()
+    return {
+        "mode": mode,
+        "workers": n_workers,
+        "units": units,
+        "seconds": round(elapsed, 2),
+        "pages/s": round(len(links) / elapsed, 3),
+        "peak RSS MB": round(peak[0] / 2**20, 1),
+    }
+
+
+def simulate(n_workers: int, n_towns: int, capacity: int, adaptive: bool) -> dict:
+    """
+    Scrapes fake towns from a simulated site that throttles above capacity
+    concurrent requests: every request over capacity adds latency and
+    raises the chance of a failed attempt. Towns have 1 to 20 blocks, one
+    request each, so their total time varies like on the real site.
+
+    Returns
+    -------
+    dict
+        towns per second, failed attempts and the limit over time
+    """
+    controller = AIMDController(n_workers) if adaptive else None
+    lock = threading.Lock()
+    active = [0]
+
+    def fake_town():
+        tic = time.perf_counter()
+        errors = 0
+        n_blocks = random.randint(1, 20)
+        for _ in range(n_blocks):
+            for _ in range(5):
+                with lock:
+                    active[0] += 1
+                    overload = max(0, active[0] - capacity)
+                time.sleep(0.01 * (1 + overload))
+                with lock:
+                    active[0] -= 1
+                if random.random() >= min(0.9, 0.05 * overload):
+                    break
+                errors += 1
+        return (time.perf_counter() - tic) / n_blocks, errors
+
+    pending, futures, failed = n_towns, set(), 0
+    tic = time.perf_counter()
+    with ThreadPoolExecutor(n_workers) as pool:
+        while pending or futures:
+            limit = controller.limit if controller else n_workers
+            while pending and len(futures) < limit:
+                futures.add(pool.submit(fake_town))
+                pending -= 1
+            done, futures = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                block_latency, errors = future.result()
+                failed += errors
+                if controller:
+                    controller.record(block_latency, errors)
+    elapsed = time.perf_counter() - tic
+    return {
+        "mode": "adaptive" if adaptive else "fixed",
+        "workers": n_workers,
+        "towns/s": round(n_towns / elapsed, 1),
+        "failed attempts": failed,
+        "limit over time": [
+            (round(t, 2), limit) for t, limit in controller.history
+        ]
+        if controller
+        else None,
+    }
+
+
+def load_test(url: str, n_requests: int, concurrency: int) -> dict:
+    """
+    Sends random filter queries to a running serve command from several
+    threads, towns and flat types are taken from /facets
+
+    Returns
+    -------
+    dict
+        requests per second and latency percentiles in ms
+    """
+    with urllib.request.urlopen(f"{url}/facets") as response:
+        facets = json.load(response)
+    towns, flat_types = list(facets["towns"]), list(facets["flat_types"])
+
+    def random_query() -> str:
+        params = [f"town={random.choice(towns)}"] if random.random() < 0.7 else []
+        if random.random() < 0.7:
+            params.append(f"flat_type={random.choice(flat_types)}")
+        if random.random() < 0.5:
+            params.append(f"max_price={random.randrange(300_000, 900_000, 50_000)}")
+        if random.random() < 0.3:
+            params.append(f"min_level={random.randrange(1, 20, 5)}")
+        return f"{url}/units?{'&'.join(params)}&limit=50".replace(" ", "%20")
+
+    latencies = []
+
+    def worker(n: int):
+        for _ in range(n):
+            tic = time.perf_counter()
+            with urllib.request.urlopen(random_query()) as response:
+                response.read()
+            latencies.append(time.perf_counter() - tic)
+
+    tic = time.perf_counter()
+    threads = [
+        threading.Thread(target=worker, args=(n_requests // concurrency,))
+        for _ in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - tic
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "requests/s": round(len(latencies) / elapsed, 1),
+        "p50 ms": round(quantiles[49] * 1000, 2),
+        "p99 ms": round(quantiles[98] * 1000, 2),
+    }
+
+
+def fake_towns(n_towns: int, units_per_town: int) -> list[list[dict]]:
+    """
+    Towns shaped like scraped ones, for export benchmarks without a browser
+    """
+    towns = ["Tampines", "Ang Mo Kio", "Bedok", "Jurong West", "Punggol", "Sengkang"]
+    return [
+        [
+            {
+                "Town": towns[t % len(towns)],
+                "Probable Completion Date": datetime.datetime(2027, 1 + t % 12, 1),
+                "Remaining Lease": 95,
+                "Est months": "",
+                "Keys Available": False,
+                "flat_type": random.choice(["2-Room Flexi", "3-Room", "4-Room", "5-Room"]),
+                "Block": str(100 + i % 20),
+                "level": random.randint(1, 30),
+                "unit": f"#{random.randint(1, 30):02d}-{i:03d}",
+                "sqm": random.randint(40, 120),
+                "price": random.randrange(150_000, 900_000, 1000),
+                "Chinese": "Available",
+                "Malay": "Available",
+                "Indian/Others": "-",
+                "Link": f"https://homes.hdb.gov.sg/home/sbf/{t}",
+            }
+            for i in range(units_per_town)
+        ]
+        for t in range(n_towns)
+    ]
+
+
+def export_benchmark(n_towns: int, units_per_town: int, max_workers: int, fmt: str) -> list:
+    """
+    Exports the same fake towns into a single excel file, then sharded
+    by town with 1, 2, 4, ... up to max_workers processes
+
+    Returns
+    -------
+    list
+        seconds and speedup over the single file per run
+    """
+    towns = fake_towns(n_towns, units_per_town)
+    directory = tempfile.mkdtemp()
+    try:
+        tic = time.perf_counter()
+        export_towns(os.path.join(directory, "single.xlsx"), towns)
+        single = time.perf_counter() - tic
+        results = [{"export": "single xlsx", "seconds": round(single, 2)}]
+        n_workers = 1
+        while n_workers <= max_workers:
+            tic = time.perf_counter()
+            export_shards(
+                os.path.join(directory, str(n_workers)), towns, fmt=fmt, n_workers=n_workers
+            )
+            elapsed = time.perf_counter() - tic
+            results.append(
+                {
+                    "export": f"sharded {fmt}",
+                    "workers": n_workers,
+                    "seconds": round(elapsed, 2),
+                    "speedup": round(single / elapsed, 2),
+                }
+            )
+            n_workers *= 2
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare pages per second and RSS of the concurrency modes"
+    )
+    parser.add_argument("--towns", type=int, default=20, help="Towns per mode")
+    parser.add_argument("--workers", type=int, default=4, help="Tabs or processes")
+    parser.add_argument(
+        "--modes", nargs="+", default=["tabs", "process"], choices=SBFScraper.MODES
+    )
+    parser.add_argument(
+        "--simulate",
+        type=int,
+        metavar="CAPACITY",
+        help="Compare fixed and adaptive concurrency against a simulated site "
+        "that throttles above CAPACITY concurrent requests, no browser needed",
+    )
+    parser.add_argument(
+        "--load",
+        metavar="URL",
+        help="Load test a running serve command, e.g. http://127.0.0.1:8000",
+    )
+    parser.add_argument("--requests", type=int, default=2000, help="Requests to send")
+    parser.add_argument("--concurrency", type=int, default=16, help="Client threads")
+    parser.add_argument(
+        "--export",
+        action="store_true",
+        help="Compare single file export against sharded export with up to "
+        "--workers processes on --towns fake towns, no browser needed",
+    )
+    parser.add_argument("--units", type=int, default=2500, help="Units per fake town")
+    parser.add_argument("--format", choices=["xlsx", "csv"], default="xlsx")
+    args = parser.parse_args()
+    if args.export:
+        for result in export_benchmark(args.towns, args.units, args.workers, args.format):
+            print(result)
+    elif args.load:
+        print(load_test(args.load, args.requests, args.concurrency))
+    elif args.simulate:
+        for adaptive in (False, True):
+            print(simulate(args.workers, args.towns, args.simulate, adaptive))
+    else:
+        for mode in args.modes:
+            print(benchmark(mode, args.workers, args.towns))
@@ -1,5 +1,10 @@
 import argparse
-from src import SBFScraper
+import os
+from src import CaptureArchive, CrawlScope, SBFScraper
+from src.diff import diff_units, read_run, write_diff
+from src.export import export_towns
+from src.serve import UnitServer
+from src.shard import FORMATS, SHARD_KEYS
 import logging
 
 # set up logging
@@ -15,6 +20,161 @@ logging.basicConfig(
 if __name__ == "__main__":
     # get file naem from args
     parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "command",
+        nargs="?",
+        choices=["scrape", "serve"],
+        default="scrape",
+        help="scrape the website, or serve the latest output over HTTP",
+    )
     parser.add_argument("-f", help="Name of file to save to")
+    parser.add_argument(
+        "--mode",
+        choices=SBFScraper.MODES,
+        default="serial",
+        help="Scrape towns one at a time, over tabs of one Chrome, or over processes",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=4, help="Number of tabs or processes"
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="Adjust active tabs or processes to the site's latency and failures",
+    )
+    parser.add_argument(
+        "--page-load-timeout",
+        type=int,
+        default=60,
+        help="Seconds before a page load is abandoned",
+    )
+    parser.add_argument(
+        "--town-timeout",
+        type=int,
+        default=600,
+        help="Seconds a town may take before its worker is replaced",
+    )
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        metavar="SECONDS",
+        help="Scrape the most valuable towns first and stop starting towns "
+        "that no longer fit, skipped towns come first next time",
+    )
+    parser.add_argument(
+        "--towns", nargs="+", metavar="TOWN", help="Only scrape these towns"
+    )
+    parser.add_argument(
+        "--exclude-towns", nargs="+", metavar="TOWN", help="Never scrape these towns"
+    )
+    parser.add_argument(
+        "--flat-types",
+        nargs="+",
+        metavar="FLAT_TYPE",
+        help="Only scrape these flat types, e.g. 4-Room 5-Room",
+    )
+    parser.add_argument("--min-price", type=int, help="Only keep units from this price")
+    parser.add_argument("--max-price", type=int, help="Only keep units up to this price")
+    parser.add_argument("--min-level", type=int, help="Only keep units from this floor")
+    parser.add_argument("--max-level", type=int, help="Only keep units up to this floor")
+    parser.add_argument(
+        "--shard-by",
+        choices=list(SHARD_KEYS),
+        help="Write one file per town or flat type in parallel, with a manifest",
+    )
+    parser.add_argument(
+        "--shard-format", choices=FORMATS, default="xlsx", help="Format of the shards"
+    )
+    parser.add_argument(
+        "--export-workers",
+        type=int,
+        help="Processes writing the shards or reading the runs of --diff, "
+        "by default the number of cores",
+    )
+    parser.add_argument(
+        "--merge",
+        action="store_true",
+        help="Merge the shards into a single file afterwards",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve live crawl metrics on http://127.0.0.1:PORT/metrics",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        metavar="PATH",
+        help="Rewrite live crawl metrics into a file every 5 seconds, e.g. sbf.prom",
+    )
+    parser.add_argument(
+        "--capture",
+        metavar="DIR",
+        help="Record the page texts in an archive, e.g. captures",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="RUN_ID",
+        help="Parse a recorded run from the --capture archive instead of scraping",
+    )
+    parser.add_argument(
+        "--diff",
+        nargs=2,
+        metavar=("OLD", "NEW"),
+        help="Report added, sold and repriced units between two runs, "
+        "each an excel file or a run id of the --capture archive",
+    )
+    parser.add_argument(
+        "--port", type=int, default=8000, help="Port of the serve command"
+    )
     args = parser.parse_args()
-    SBFScraper(filename=args.f).run()
+    if args.command == "serve":
+        UnitServer(port=args.port).serve_forever()
+    elif args.diff:
+        old, new = args.diff
+        archive = CaptureArchive(args.capture) if args.capture else None
+        stems = [os.path.splitext(os.path.basename(x))[0] for x in args.diff]
+        name = (args.f or f"diff_{stems[0]}_{stems[1]}").removesuffix(".xlsx")
+        os.makedirs("outputs", exist_ok=True)
+        counts = write_diff(
+            os.path.join("outputs", name + ".xlsx"),
+            diff_units(
+                read_run(old, archive, args.export_workers),
+                read_run(new, archive, args.export_workers),
+            ),
+        )
+        logging.info("Diff written: %s", counts)
+    elif args.replay:
+        archive = CaptureArchive(args.capture or "captures")
+        name = (args.f or f"{args.replay}_replay").removesuffix(".xlsx")
+        os.makedirs("outputs", exist_ok=True)
+        total = export_towns(
+            os.path.join("outputs", name + ".xlsx"),
+            SBFScraper.replay(archive, args.replay),
+        )
+        logging.info("%s flats replayed from %s", total, args.replay)
+    else:
+        SBFScraper(
+            filename=args.f,
+            mode=args.mode,
+            n_workers=args.workers,
+            adaptive=args.adaptive,
+            page_load_timeout=args.page_load_timeout,
+            town_timeout=args.town_timeout,
+            capture=args.capture,
+            time_budget=args.time_budget,
+            scope=CrawlScope(
+                towns=args.towns,
+                exclude_towns=args.exclude_towns,
+                flat_types=args.flat_types,
+                min_price=args.min_price,
+                max_price=args.max_price,
+                min_level=args.min_level,
+                max_level=args.max_level,
+            ),
+            shard_by=args.shard_by,
+            shard_format=args.shard_format,
+            export_workers=args.export_workers,
+            merge=args.merge,
+            metrics_port=args.metrics_port,
+            metrics_file=args.metrics_file,
+        ).run()
@@ -1 +1,3 @@
-from .sbfscraper import SBFScraper
\ No newline at end of file
+from .sbfscraper import SBFScraper
+from .capture import CaptureArchive
+from .scope import CrawlScope
@@ -0,0 +1,244 @@
+import math
+import statistics
+
+
+class P2Quantile:
+    """
+    Streaming quantile estimate using the P-square algorithm
+    (Jain & Chlamtac, 1985). Only 5 markers are kept, so memory does not
+    grow with the number of observations.
+    """
+
+    def __init__(self, p: float = 0.5):
+        """
+        Parameters
+        ----------
+        p : float, optional
+            quantile to estimate, by default 0.5 (median)
+        """
+        self._p = p
+        self._heights = []
+        self._positions = [1, 2, 3, 4, 5]
+        self._desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self._increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x: float):
+        """
+        Adds an observation
+        """
+        heights = self._heights
+        if len(heights) < 5:
+            heights.append(x)
+            heights.sort()
+            return
+
+        # find the cell k the observation falls into, adjusting the extremes
+        if x < heights[0]:
+            heights[0] = x
+            k = 0
+        elif x >= heights[4]:
+            heights[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= heights[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            self._positions[i] += 1
+        for i in range(5):
+            self._desired[i] += self._increments[i]
+
+        # adjust the middle markers if they are off their desired position
+        for i in range(1, 4):
+            d = self._desired[i] - self._positions[i]
+            if (d >= 1 and self._positions[i + 1] - self._positions[i] > 1) or (
+                d <= -1 and self._positions[i - 1] - self._positions[i] < -1
+            ):
+                d = int(math.copysign(1, d))
+                height = self._parabolic(i, d)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = self._linear(i, d)
+                heights[i] = height
+                self._positions[i] += d
+
+    def _parabolic(self, i: int, d: int) -> float:
+        q, n = self._heights, self._positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def _linear(self, i: int, d: int) -> float:
+        q, n = self._heights, self._positions
+        return q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+
+    @property
+    def value(self) -> float:
+        """
+        Current estimate, exact while fewer than 5 observations were added
+        """
+        heights = self._heights
+        if not heights:
+            return 0
+        if len(heights) < 5:
+            index = (len(heights) - 1) * self._p
+            lower = int(index)
+            upper = min(lower + 1, len(heights) - 1)
+            return heights[lower] + (heights[upper] - heights[lower]) * (index - lower)
+        return heights[2]
+
+
+class RunningStats:
+    """
+    Count, min, max, mean and median of a stream of values
+    The median is exact up to EXACT_LIMIT values, most groups are far
+    smaller, and estimated with P-square above that, so memory stays
+    bounded for large groups
+    """
+
+    EXACT_LIMIT = 512
+
+    def __init__(self):
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self._total = 0
+        self._values = []
+        self._median = P2Quantile(0.5)
+
+    def add(self, x: float):
+        """
+        Adds an observation
+        """
+        self.count += 1
+        self._total += x
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+        self._median.add(x)
+        if self._values is not None:
+            self._values.append(x)
+            if len(self._values) > self.EXACT_LIMIT:
+                self._values = None
+
+    @property
+    def mean(self) -> float:
+        return self._total / self.count if self.count else 0
+
+    @property
+    def median(self) -> float:
+        if self._values is not None:
+            return statistics.median(self._values) if self._values else 0
+        return self._median.value
+
+    def summary(self, prefix: str) -> dict:
+        """
+        Returns the statistics as a flat dictionary
+
+        Parameters
+        ----------
+        prefix : str
+            prefix of the keys, e.g. "price"
+
+        Returns
+        -------
+        dict
+            dictionary of statistics, empty values if nothing was added
+        """
+        if not self.count:
+            return dict.fromkeys(
+                (f"{prefix} min", f"{prefix} max", f"{prefix} mean", f"{prefix} median"), ""
+            )
+        return {
+            f"{prefix} min": round(self.min, 2),
+            f"{prefix} max": round(self.max, 2),
+            f"{prefix} mean": round(self.mean, 2),
+            f"{prefix} median": round(self.median, 2),
+        }
+
+
+def floor_band(level: int, size: int = 5) -> str:
+    """
+    Groups the floor level into bands, e.g. 01-05, 06-10
+
+    Parameters
+    ----------
+    level : int
+        floor level
+    size : int, optional
+        levels per band, by default 5
+
+    Returns
+    -------
+    str
+        floor band
+    """
+    start = (level - 1) // size * size + 1
+    return f"{start:02d}-{start + size - 1:02d}"
+
+
+class Aggregator:
+    """
+    Keeps running statistics of price and price per sqm per group
+    as rows arrive, so the summary sheets need no pass over the raw rows
+    1. Town x flat type
+    2. Floor band
+    """
+
+    GROUPINGS = {
+        "By Town and Flat Type": ("Town", "flat_type"),
+        "By Floor Band": ("Floor Band",),
+    }
+
+    def __init__(self):
+        self._groups = {name: {} for name in self.GROUPINGS}
+
+    def add(self, row: dict):
+        """
+        Adds a single row to every grouping
+
+        Parameters
+        ----------
+        row : dict
+            scraped row
+        """
+        keys = {
+            "Town": row.get("Town", ""),
+            "flat_type": row.get("flat_type", ""),
+            "Floor Band": floor_band(row["level"]),
+        }
+        for name, columns in self.GROUPINGS.items():
+            key = tuple(keys[column] for column in columns)
+            stats = self._groups[name].get(key)
+            if stats is None:
+                stats = self._groups[name][key] = (RunningStats(), RunningStats())
+            stats[0].add(row["price"])
+            # a unit without a floor area has no price per sqm
+            if row["sqm"]:
+                stats[1].add(row["price"] / row["sqm"])
+
+    def add_rows(self, rows: list[dict]):
+        """
+        Adds a list of rows
+        """
+        for row in rows:
+            self.add(row)
+
+    def tables(self) -> dict:
+        """
+        Returns the summary tables, one list of rows per grouping
+
+        Returns
+        -------
+        dict
+            sheet name to list of row dictionaries
+        """
+        tables = {}
+        for name, columns in self.GROUPINGS.items():
+            tables[name] = [
+                dict(zip(columns, key))
+                | {"count": price.count}
+                | price.summary("price")
+                | price_per_sqm.summary("price per sqm")
+                for key, (price, price_per_sqm) in sorted(self._groups[name].items())
+            ]
+        return tables
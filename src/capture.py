@@ -0,0 +1,265 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import zlib
+from functools import lru_cache
+from typing import Iterator
+
+
+class CaptureArchive:
+    """
+    Stores the raw page text of every scraped block, so a run can be
+    parsed again without the website
+
+    Texts are zlib compressed and stored once per content hash, blocks
+    that did not change between runs take no extra space besides their
+    index line. Layout of the archive directory:
+
+    objects/ab/abcdef....z      compressed text, named by its sha256
+    runs/<run_id>/<pid>.jsonl   one line per block, hashes of its texts
+    runs/<run_id>/scope.json    scope of the run, blocks are stored unfiltered
+    """
+
+    def __init__(self, root: str = "captures", run_id: str = None, scope: dict = None):
+        """
+        Parameters
+        ----------
+        root : str, optional
+            directory of the archive, by default "captures"
+        run_id : str, optional
+            name of the run that is being recorded, not needed for reading.
+            An earlier recording under the same name is replaced, like the
+            excel file it is named after
+        scope : dict, optional
+            scope of the run that is being recorded, e.g. CrawlScope.to_dict(),
+            by default None
+        """
+        self._root = root
+        self._run_id = run_id
+        self._index_file = None
+        self._index_pid = None
+        self._indexes = {}
+        # per instance, a cache on the method would keep every archive alive
+        self.get = lru_cache(maxsize=4096)(self._get)
+        if run_id is not None:
+            run_dir = os.path.join(root, "runs", run_id)
+            if os.path.isdir(run_dir):
+                logging.info("Replacing the recorded run %s", run_id)
+                shutil.rmtree(run_dir)
+            if scope is not None:
+                os.makedirs(run_dir, exist_ok=True)
+                with open(os.path.join(run_dir, "scope.json"), "w", encoding="utf-8") as f:
+                    json.dump(scope, f, indent=1)
+
+    def __getstate__(self):
+        # open files stay with the process that opened them
+        state = self.__dict__.copy()
+        state["_index_file"] = None
+        state["_index_pid"] = None
+        state.pop("get")
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.get = lru_cache(maxsize=4096)(self._get)
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self._root, "objects", digest[:2], digest + ".z")
+
+    def put(self, text: str) -> str:
+        """
+        Stores a text if it is not stored yet
+
+        Parameters
+        ----------
+        text : str
+            page text
+
+        Returns
+        -------
+        str
+            content hash of the text
+        """
+        data = text.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # write then rename, so other processes never read half a file
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(zlib.compress(data, 9))
+            os.replace(tmp, path)
+        return digest
+
+    def _get(self, digest: str) -> str:
+        """
+        Reads a text by its content hash
+
+        Parameters
+        ----------
+        digest : str
+            content hash
+
+        Returns
+        -------
+        str
+            page text
+        """
+        with open(self._object_path(digest), "rb") as f:
+            return zlib.decompress(f.read()).decode("utf-8")
+
+    def record(self, link: str, town_text: str, blocks: list[tuple]):
+        """
+        Records every block of a town in the index of the current run
+        Each worker process appends to its own index file
+
+        Parameters
+        ----------
+        link : str
+            link to the town
+        town_text : str
+            town details text
+        blocks : list[tuple]
+            (flat_type, block, ethnic text, grid text) per block
+        """
+        if self._index_file is None or self._index_pid != os.getpid():
+            run_dir = os.path.join(self._root, "runs", self._run_id)
+            os.makedirs(run_dir, exist_ok=True)
+            self._index_pid = os.getpid()
+            self._index_file = open(
+                os.path.join(run_dir, f"{self._index_pid}.jsonl"),
+                "a",
+                encoding="utf-8",
+            )
+        town = self.put(town_text)
+        lines = []
+        for flat_type, block, ethnic_text, grid_text in blocks:
+            entry = {
+                "link": link,
+                "flat_type": flat_type,
+                "block": block,
+                "town": town,
+                "ethnic": self.put(ethnic_text),
+                "grid": self.put(grid_text),
+            }
+            lines.append(json.dumps(entry) + "\n")
+        self._index_file.writelines(lines)
+        self._index_file.flush()
+
+    def runs(self) -> list[str]:
+        """
+        Returns
+        -------
+        list[str]
+            ids of every recorded run, oldest first
+        """
+        runs_dir = os.path.join(self._root, "runs")
+        if not os.path.isdir(runs_dir):
+            return []
+        return sorted(os.listdir(runs_dir))
+
+    def scope(self, run_id: str) -> dict:
+        """
+        Returns
+        -------
+        dict
+            scope the run was recorded with, empty if none was stored
+        """
+        path = os.path.join(self._root, "runs", run_id, "scope.json")
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def entries(self, run_id: str) -> Iterator[dict]:
+        """
+        Reads the index of a run
+        A block recorded more than once, e.g. by a worker that was killed
+        after recording its town, is only read the first time
+
+        Parameters
+        ----------
+        run_id : str
+            id of the run
+
+        Yields
+        ------
+        dict
+            link, flat_type, block and the hashes of the block's texts
+        """
+        run_dir = os.path.join(self._root, "runs", run_id)
+        seen = set()
+        for name in sorted(os.listdir(run_dir)):
+            if not name.endswith(".jsonl"):
+                continue
+            with open(os.path.join(run_dir, name), "r", encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    key = (entry["link"], entry["flat_type"], entry["block"])
+                    if key not in seen:
+                        seen.add(key)
+                        yield entry
+
+    def lookup(self, run_id: str, link: str, flat_type: str, block: str) -> dict:
+        """
+        Reads the texts of a single block
+        The index of the run is loaded once and kept in memory
+
+        Parameters
+        ----------
+        run_id : str
+            id of the run
+        link : str
+            link to the town
+        flat_type : str
+            flat type, e.g. 4-Room
+        block : str
+            block number
+
+        Returns
+        -------
+        dict
+            town, ethnic and grid texts of the block
+        """
+        if run_id not in self._indexes:
+            self._indexes[run_id] = {
+                (entry["link"], entry["flat_type"], entry["block"]): entry
+                for entry in self.entries(run_id)
+            }
+        entry = self._indexes[run_id][(link, flat_type, block)]
+        return self._texts(entry)
+
+    def replay(self, run_id: str) -> Iterator[dict]:
+        """
+        Reads every block of a run in recorded order
+
+        Parameters
+        ----------
+        run_id : str
+            id of the run
+
+        Yields
+        ------
+        dict
+            link, flat_type, block and the town, ethnic and grid texts
+        """
+        for entry in self.entries(run_id):
+            yield self._texts(entry)
+
+    def _texts(self, entry: dict) -> dict:
+        return {
+            "link": entry["link"],
+            "flat_type": entry["flat_type"],
+            "block": entry["block"],
+            "town": self.get(entry["town"]),
+            "ethnic": self.get(entry["ethnic"]),
+            "grid": self.get(entry["grid"]),
+        }
+
+    def close(self):
+        if self._index_file is not None:
+            self._index_file.close()
+            self._index_file = None
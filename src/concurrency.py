@@ -0,0 +1,112 @@
+import logging
+import math
+import time
+
+
+class AIMDController:
+    """
+    Adapts the number of towns scraped at the same time
+    Additive increase, multiplicative decrease: the limit grows by one
+    after every healthy window of results and is cut when the site starts
+    throttling, which shows up as failed attempts or rising latency.
+    """
+
+    def __init__(
+        self,
+        max_limit: int,
+        min_limit: int = 1,
+        initial: int = None,
+        window: int = None,
+        failure_threshold: float = 0.1,
+        latency_factor: float = 2.0,
+        decrease: float = 0.5,
+    ):
+        """
+        Parameters
+        ----------
+        max_limit : int
+            upper bound, e.g. number of tabs or processes
+        min_limit : int, optional
+            lower bound, by default 1
+        initial : int, optional
+            starting limit, by default min_limit
+        window : int, optional
+            results per decision, by default the current limit
+        failure_threshold : float, optional
+            share of failed attempts that counts as throttling, by default 0.1
+        latency_factor : float, optional
+            mean latency above this multiple of the best window counts as
+            throttling, by default 2.0
+        decrease : float, optional
+            factor applied to the limit when throttled, by default 0.5
+        """
+        self._min = min_limit
+        self._max = max_limit
+        self.limit = initial or min_limit
+        self._window = window
+        self._failure_threshold = failure_threshold
+        self._latency_factor = latency_factor
+        self._decrease = decrease
+        self._best_latency = math.inf
+        self._cooldown = 0
+        self._reset()
+        # (seconds since start, limit) every time the limit changes
+        self._start = time.perf_counter()
+        self.history = [(0.0, self.limit)]
+
+    def _reset(self):
+        self._results = 0
+        self._attempts = 0
+        self._failures = 0
+        self._latency = 0.0
+        self._timed = 0
+
+    def record(self, latency: float, errors: int = 0):
+        """
+        Records a finished town and adjusts the limit once per window
+
+        Parameters
+        ----------
+        latency : float
+            seconds per block of the town, a whole town's time depends
+            on its number of blocks more than on the site, None if no
+            block was read
+        errors : int, optional
+            number of failed attempts for the town, by default 0
+        """
+        if self._cooldown:
+            # started before the last decrease, says nothing about the new limit
+            self._cooldown -= 1
+            return
+        self._results += 1
+        self._attempts += 1 + errors
+        self._failures += errors
+        if latency is not None:
+            self._latency += latency
+            self._timed += 1
+        if self._results < (self._window or self.limit):
+            return
+
+        failure_rate = self._failures / self._attempts
+        mean_latency = self._latency / self._timed if self._timed else math.nan
+        if self._timed:
+            self._best_latency = min(self._best_latency, mean_latency)
+        throttled = (
+            failure_rate > self._failure_threshold
+            or mean_latency > self._best_latency * self._latency_factor
+        )
+        if throttled:
+            limit = max(self._min, int(self.limit * self._decrease))
+            self._cooldown = self.limit - 1
+        else:
+            limit = min(self._max, self.limit + 1)
+        if limit != self.limit:
+            self.limit = limit
+            self.history.append((time.perf_counter() - self._start, limit))
+        logging.info(
+            "Concurrency %d (%.2fs per block, failure rate %.0f%%)",
+            self.limit,
+            mean_latency,
+            failure_rate * 100,
+        )
+        self._reset()
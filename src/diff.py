@@ -0,0 +1,109 @@
+import os
+from operator import itemgetter
+from typing import Iterator
+from xlsxwriter import Workbook
+from .sbfscraper import SBFScraper
+from .xlsx_reader import iter_sheet_rows
+
+KEY = ("Link", "flat_type", "Block", "level", "unit")
+COLUMNS = KEY + ("sqm", "price")
+
+
+def diff_units(old_rows, new_rows) -> Iterator[tuple]:
+    """
+    Compares two runs with a hash join on (Link, flat_type, Block, level, unit)
+    Only the key and price of the old run are kept in memory, the new run
+    is streamed
+
+    Parameters
+    ----------
+    old_rows : Iterable[dict]
+        units of the older run
+    new_rows : Iterable[dict]
+        units of the newer run
+
+    Yields
+    ------
+    tuple
+        ("added" | "sold" | "repriced", row), repriced rows have the old
+        and new price
+    """
+    get_key = itemgetter(*KEY)
+    old = {get_key(row): (row["sqm"], row["price"]) for row in old_rows}
+    for row in new_rows:
+        match = old.pop(get_key(row), None)
+        if match is None:
+            yield "added", {column: row[column] for column in COLUMNS}
+        elif match[1] != row["price"]:
+            yield "repriced", {column: row[column] for column in KEY} | {
+                "sqm": row["sqm"],
+                "old price": match[1],
+                "new price": row["price"],
+                "change": row["price"] - match[1],
+            }
+    for key, (sqm, price) in old.items():
+        yield "sold", dict(zip(KEY, key)) | {"sqm": sqm, "price": price}
+
+
+def write_diff(filename: str, changes) -> dict:
+    """
+    Writes the changes into the Added, Sold and Repriced sheets
+
+    Parameters
+    ----------
+    filename : str
+        path of excel file to save to
+    changes : Iterable[tuple]
+        output of diff_units
+
+    Returns
+    -------
+    dict
+        number of rows per sheet
+    """
+    wb = Workbook(filename, {"constant_memory": True, "strings_to_urls": False})
+    sheets = {
+        kind: wb.add_worksheet(kind.capitalize())
+        for kind in ("added", "sold", "repriced")
+    }
+    rows = dict.fromkeys(sheets, 0)
+    for kind, change in changes:
+        ws = sheets[kind]
+        if rows[kind] == 0:
+            for col, header in enumerate(change):
+                ws.write(0, col, header)
+        rows[kind] += 1
+        for col, value in enumerate(change.values()):
+            ws.write(rows[kind], col, value)
+    wb.close()
+    return rows
+
+
+def read_run(source: str, archive=None, n_workers: int = None) -> Iterator[dict]:
+    """
+    Streams the units of a run, either an excel file or a recorded run
+
+    Parameters
+    ----------
+    source : str
+        path of an excel file, or a run id of the archive
+    archive : CaptureArchive, optional
+        archive holding recorded runs, by default None
+    n_workers : int, optional
+        number of processes reading an excel file, by default the number
+        of cores
+
+    Yields
+    ------
+    dict
+        unit
+    """
+    if source.endswith(".xlsx") or os.path.exists(source):
+        yield from iter_sheet_rows(
+            source, columns=COLUMNS, n_workers=n_workers or os.cpu_count()
+        )
+        return
+    if archive is None:
+        raise FileNotFoundError(source)
+    for dict_by_town in SBFScraper.replay(archive, source):
+        yield from dict_by_town
@@ -0,0 +1,124 @@
+import datetime
+
+# HDB classification of estates, keyed by the town name shown on the SBF page
+MATURE_ESTATES = frozenset(
+    {
+        "ang mo kio",
+        "bedok",
+        "bishan",
+        "bukit merah",
+        "bukit timah",
+        "central area",
+        "clementi",
+        "geylang",
+        "kallang/whampoa",
+        "marine parade",
+        "pasir ris",
+        "queenstown",
+        "serangoon",
+        "tampines",
+        "toa payoh",
+    }
+)
+
+NON_MATURE_ESTATES = frozenset(
+    {
+        "bukit batok",
+        "bukit panjang",
+        "choa chu kang",
+        "hougang",
+        "jurong east",
+        "jurong west",
+        "punggol",
+        "sembawang",
+        "sengkang",
+        "tengah",
+        "woodlands",
+        "yishun",
+    }
+)
+
+
+def months_to(date, today: datetime.date) -> int:
+    """
+    Number of whole months from today until date, 0 if already past
+    Mirrors the DATEDIF(TODAY(), date, "M") formula previously written to excel
+
+    Parameters
+    ----------
+    date : datetime
+        probable completion date, or "" when keys are available
+    today : datetime.date
+        reference date
+
+    Returns
+    -------
+    int
+        months until completion
+    """
+    if not isinstance(date, datetime.date):
+        return 0
+    months = (date.year - today.year) * 12 + date.month - today.month
+    if date.day < today.day:
+        months -= 1
+    return max(months, 0)
+
+
+def estate_type(town: str):
+    """
+    Looks up the town in the estate tables
+
+    Parameters
+    ----------
+    town : str
+        town name
+
+    Returns
+    -------
+    bool or str
+        True if mature, False if non-mature, "" if unknown
+    """
+    town = (town or "").strip().lower()
+    if town in MATURE_ESTATES:
+        return True
+    if town in NON_MATURE_ESTATES:
+        return False
+    return ""
+
+
+def enrich(rows: list[dict], today: datetime.date = None) -> list[dict]:
+    """
+    Fills the derived columns of the scraped rows in place
+    1. Est months
+    2. Price per sqm
+    3. Mature Estate
+
+    Rows of the same town share the completion date and town name, so
+    each distinct value is only computed once and then looked up.
+
+    Parameters
+    ----------
+    rows : list[dict]
+        scraped rows
+    today : datetime.date, optional
+        reference date for Est months, by default today
+
+    Returns
+    -------
+    list[dict]
+        the same rows with derived columns
+    """
+    today = today or datetime.date.today()
+    months_cache = {}
+    estate_cache = {}
+    for row in rows:
+        date = row.get("Probable Completion Date", "")
+        if date not in months_cache:
+            months_cache[date] = months_to(date, today)
+        town = row.get("Town", "")
+        if town not in estate_cache:
+            estate_cache[town] = estate_type(town)
+        row["Est months"] = months_cache[date]
+        row["Price per sqm"] = round(row["price"] / row["sqm"], 2) if row["sqm"] else 0
+        row["Mature Estate"] = estate_cache[town]
+    return rows
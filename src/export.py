@@ -0,0 +1,209 @@
+import datetime
+import queue
+import threading
+from xlsxwriter import Workbook
+import win32com.client as win32
+from .aggregate import Aggregator
+from .enrich import enrich
+
+
+class XlsxExporter:
+    """
+    Writes the scraped rows into the "Raw Data" sheet of an excel file
+    Values are written as static typed cells, no formulas
+    """
+
+    def __init__(self, filename: str):
+        """
+        Parameters
+        ----------
+        filename : str
+            Path of excel file to save to
+        """
+        self._filename = filename
+        # rows are always written top to bottom, so only the current row
+        # needs to be held in memory. Links stay plain strings, excel allows
+        # only 65530 hyperlinks per sheet and drops the rest
+        self._wb = Workbook(
+            filename, {"constant_memory": True, "strings_to_urls": False}
+        )
+        self._ws = self._wb.add_worksheet("Raw Data")
+        self._date_format = self._wb.add_format({"num_format": "mm/dd/yyyy"})
+        self._headers = None
+        self._row = 1
+
+    def write_rows(self, rows: list[dict]):
+        """
+        Writes rows below the previously written rows
+        The header is taken from the keys of the first row
+
+        Parameters
+        ----------
+        rows : list[dict]
+            list of row dictionaries
+        """
+        for details in rows:
+            if self._headers is None:
+                self._headers = {key: col for col, key in enumerate(details)}
+                for header, col in self._headers.items():
+                    self._ws.write(0, col, header)
+            for _key, _value in details.items():
+                col = self._headers[_key]
+                if isinstance(_value, datetime.datetime):
+                    self._ws.write_datetime(self._row, col, _value, self._date_format)
+                else:
+                    self._ws.write(self._row, col, _value)
+            self._row += 1
+
+    def write_table(self, sheet_name: str, rows: list[dict]):
+        """
+        Writes rows into a new worksheet, e.g. summary tables
+
+        Parameters
+        ----------
+        sheet_name : str
+            name of the new worksheet
+        rows : list[dict]
+            list of row dictionaries, all with the same keys
+        """
+        ws = self._wb.add_worksheet(sheet_name)
+        if not rows:
+            return
+        for col, header in enumerate(rows[0]):
+            ws.write(0, col, header)
+        for row, details in enumerate(rows, start=1):
+            for col, _value in enumerate(details.values()):
+                ws.write(row, col, _value)
+
+    def close(self):
+        """
+        Closes the workbook and writes it to disk
+        """
+        self._wb.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BackgroundWriter(threading.Thread):
+    """
+    Hands batches of rows to a handler on a separate thread, so exporting
+    overlaps with scraping. The queue is bounded, when the writer falls
+    behind the scraper waits instead of buffering everything in memory.
+    """
+
+    _STOP = object()
+
+    def __init__(self, handler, maxsize: int = 16):
+        """
+        Parameters
+        ----------
+        handler : callable
+            called with every batch (list of rows) on the writer thread
+        maxsize : int, optional
+            maximum number of batches waiting to be written, by default 16
+        """
+        super().__init__(daemon=True)
+        self._handler = handler
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._error = None
+
+    def run(self):
+        while True:
+            batch = self._queue.get()
+            if batch is self._STOP:
+                break
+            if self._error is None:
+                try:
+                    self._handler(batch)
+                except Exception as error:
+                    # keep draining so the producer never blocks on a full queue
+                    self._error = error
+
+    def put(self, batch: list[dict]):
+        """
+        Queues a batch of rows, blocks while the queue is full
+
+        Parameters
+        ----------
+        batch : list[dict]
+            list of rows
+        """
+        if self._error is not None:
+            raise self._error
+        self._queue.put(batch)
+
+    def close(self):
+        """
+        Waits for all queued batches to be written
+        Raises the first error from the handler, if any
+        """
+        self._queue.put(self._STOP)
+        self.join()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def export_towns(filename: str, towns) -> int:
+    """
+    Writes towns into an excel file as they arrive
+    Every town is enriched, added to the summary sheets and written on a
+    writer thread, so the caller can produce the next town meanwhile
+
+    Parameters
+    ----------
+    filename : str
+        Path of excel file to save to
+    towns : Iterable[list[dict]]
+        units per town, e.g. SBFScraper.iter_units()
+
+    Returns
+    -------
+    int
+        number of units written
+    """
+    aggregator = Aggregator()
+    total = 0
+
+    def write_town(dict_by_town):
+        enrich(dict_by_town)
+        aggregator.add_rows(dict_by_town)
+        exporter.write_rows(dict_by_town)
+
+    with XlsxExporter(filename) as exporter:
+        with BackgroundWriter(write_town) as writer:
+            for dict_by_town in towns:
+                writer.put(dict_by_town)
+                total += len(dict_by_town)
+        for sheet_name, table in aggregator.tables().items():
+            exporter.write_table(sheet_name, table)
+    return total
+
+
+def autofit_columns(filename: str, sheet: str = "Raw Data"):
+    """
+    Autofits the columns using excel, only available on Windows
+
+    Parameters
+    ----------
+    filename : str
+        Path of excel file
+    sheet : str, optional
+        name of worksheet, by default "Raw Data"
+    """
+    excel = win32.gencache.EnsureDispatch("Excel.Application")
+    wb = excel.Workbooks.Open(filename)
+    ws = wb.Worksheets(sheet)
+    ws.Columns.AutoFit()
+    wb.Save()
+    excel.Application.Quit()
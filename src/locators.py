@@ -0,0 +1,313 @@
+import time
+from collections import Counter, defaultdict
+from selenium.common.exceptions import (
+    NoSuchElementException,
+    StaleElementReferenceException,
+    TimeoutException,
+)
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.wait import WebDriverWait
+from .aggregate import RunningStats
+
+# name to locators tried in order, (by, selector, parent)
+# an id or component anchored CSS selector first, the absolute XPath the
+# scraper used before as the fallback. Selectors with a parent are looked
+# up inside that element, which is resolved once per page.
+SELECTORS = {
+    "sbf_categories": (
+        (By.CSS_SELECTOR, "app-search-results app-flat-cards-categories", None),
+        (
+            By.XPATH,
+            "/html/body/app-root/div[2]/app-find-my-flat/section/div/"
+            "app-search-results/div/div/div[4]/app-flat-cards-categories",
+            None,
+        ),
+    ),
+    "page_size_select": (
+        (
+            By.CSS_SELECTOR,
+            "app-search-results > div > div > div:nth-of-type(3) > div > "
+            "div:nth-of-type(1) > div:nth-of-type(1) > div:nth-of-type(2) > select",
+            None,
+        ),
+        (
+            By.XPATH,
+            "/html/body/app-root/div[2]/app-find-my-flat/section/div/"
+            "app-search-results/div/div/div[3]/div/div[1]/div[1]/div[2]/select",
+            None,
+        ),
+    ),
+    "town_links": ((By.CSS_SELECTOR, ".flat-link", None),),
+    "next_page": ((By.CSS_SELECTOR, "[aria-label=Next]", None),),
+    "details_panel": (
+        (
+            By.CSS_SELECTOR,
+            "app-sbf-details > section > div > div:nth-of-type(3) > "
+            "div:nth-of-type(1) > div > div > div",
+            None,
+        ),
+        (
+            By.XPATH,
+            "/html/body/app-root/div[2]/app-sbf-details/section/div/div[3]/div[1]/div/div/div",
+            None,
+        ),
+    ),
+    "town_details": (
+        (By.CSS_SELECTOR, ":scope > div:nth-of-type(2) > div", "details_panel"),
+        (
+            By.XPATH,
+            "/html/body/app-root/div[2]/app-sbf-details/section/div/div[3]/div[1]/div/div/div/div[2]/div",
+            None,
+        ),
+    ),
+    "total_units": (
+        (By.CSS_SELECTOR, ":scope > div:nth-of-type(3) > table", "details_panel"),
+        (
+            By.XPATH,
+            "/html/body/app-root/div[2]/app-sbf-details/section/div/div[3]/div[1]/div/div/div/div[3]/table",
+            None,
+        ),
+    ),
+    "layout_block": ((By.CSS_SELECTOR, "#layout-block", None),),
+    "flat_type_select": (
+        (
+            By.CSS_SELECTOR,
+            ":scope > div:nth-of-type(2) > div > div > div:nth-of-type(1) > select",
+            "layout_block",
+        ),
+        (By.XPATH, "//*[@id='layout-block']/div[2]/div/div/div[1]/select", None),
+    ),
+    "flat_type_option": (
+        (By.CSS_SELECTOR, ":scope > option:nth-of-type({n})", "flat_type_select"),
+        (
+            By.XPATH,
+            "//*[@id='layout-block']/div[2]/div/div/div[1]/select/option[{n}]",
+            None,
+        ),
+    ),
+    "block_select": (
+        (
+            By.CSS_SELECTOR,
+            ":scope > div:nth-of-type(2) > div > div > div:nth-of-type(3) > select",
+            "layout_block",
+        ),
+        (By.XPATH, "//*[@id='layout-block']/div[2]/div/div/div[3]/select", None),
+    ),
+    "block_option": (
+        (By.CSS_SELECTOR, ":scope > option:nth-of-type({n})", "block_select"),
+        (
+            By.XPATH,
+            "//*[@id='layout-block']/div[2]/div/div/div[3]/select/option[{n}]",
+            None,
+        ),
+    ),
+    "ethnic_quota": (
+        (By.CSS_SELECTOR, "#available-sidebar > div:nth-of-type(1) > div:nth-of-type(2)", None),
+        (By.XPATH, "//*[@id='available-sidebar']/div[1]/div[2]", None),
+    ),
+    "unit_grid": (
+        (By.CSS_SELECTOR, "#available-grid", None),
+        (By.XPATH, "//*[@id='available-grid']", None),
+    ),
+}
+
+
+class LocatorRegistry:
+    """
+    Finds the elements of SELECTORS for a driver
+    1. locators are tried in order, the one that matched last is tried
+       first next time, so a DOM change costs a single miss per lookup
+       wait and wait_all poll only that locator, the others are tried
+       once when the wait times out
+    2. parent elements are resolved once per page and reused, a parent
+       that was re-rendered is resolved again
+    3. the time of every lookup is recorded per locator
+    """
+
+    def __init__(self, timeout: float = 10):
+        """
+        Parameters
+        ----------
+        timeout : float, optional
+            seconds wait and wait_all wait for an element, by default 10
+        """
+        self._timeout = timeout
+        self._driver = None
+        self._wait = None
+        self._parents = {}
+        # name to index of the locator that matched last
+        self._preferred = {}
+        # (name, index) to milliseconds of lookups that found something
+        self._hits = defaultdict(RunningStats)
+        self._misses = Counter()
+
+    def __getstate__(self):
+        # drivers and elements stay with the process that created them
+        state = self.__dict__.copy()
+        state["_driver"] = None
+        state["_wait"] = None
+        state["_parents"] = {}
+        return state
+
+    def use(self, driver):
+        """
+        Looks up elements with the given driver from now on
+        """
+        self._driver = driver
+        self._wait = WebDriverWait(driver, self._timeout)
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets the parent elements, call it whenever another page is shown
+        """
+        self._parents.clear()
+
+    def _parent(self, name: str, polling: bool = False):
+        element = self._parents.get(name)
+        if element is None:
+            if polling:
+                element = self._try(name, self._preferred.get(name, 0), False, {}, True)
+                if element is None:
+                    raise NoSuchElementException(f"{name} not found")
+                element = element[0]
+            else:
+                element = self.find(name)
+            self._parents[name] = element
+        return element
+
+    def _try(self, name: str, index: int, many: bool, params: dict, polling: bool):
+        # a single locator, None if it matches nothing
+        by, selector, parent = SELECTORS[name][index]
+        if params:
+            selector = selector.format(**params)
+        tic = time.perf_counter()
+        found = []
+        for _ in range(2):
+            try:
+                if parent is None:
+                    context = self._driver
+                else:
+                    context = self._parent(parent, polling)
+                if many:
+                    found = context.find_elements(by, selector)
+                else:
+                    found = [context.find_element(by, selector)]
+                break
+            except StaleElementReferenceException:
+                # the parent was re-rendered, resolve it again once
+                self._parents.pop(parent, None)
+            except NoSuchElementException:
+                break
+        if not found:
+            return None
+        self._hits[(name, index)].add((time.perf_counter() - tic) * 1000)
+        self._preferred[name] = index
+        return found
+
+    def _lookup(self, name: str, many: bool, params: dict, skip: int = None) -> list:
+        first = self._preferred.get(name, 0)
+        order = [first] + [i for i in range(len(SELECTORS[name])) if i != first]
+        for index in order:
+            if index == skip:
+                continue
+            found = self._try(name, index, many, params, False)
+            if found is not None:
+                return found
+            self._misses[(name, index)] += 1
+        return []
+
+    def _wait_for(self, name: str, many: bool, params: dict) -> list:
+        # polls only the preferred locator, so a page still loading costs
+        # no miss and never runs the slow fallbacks
+        index = self._preferred.get(name, 0)
+        try:
+            return self._wait.until(
+                lambda driver: self._try(name, index, many, params, True) or False,
+                message=f"{name} not found",
+            )
+        except TimeoutException:
+            self._misses[(name, index)] += 1
+            found = self._lookup(name, many, params, skip=index)
+            if not found:
+                raise
+            return found
+
+    def find(self, name: str, **params):
+        """
+        Finds an element without waiting
+
+        Parameters
+        ----------
+        name : str
+            name in SELECTORS
+        **params
+            values of the placeholders, e.g. n for the options
+
+        Returns
+        -------
+        WebElement
+            first matching element
+
+        Raises
+        ------
+        NoSuchElementException
+            if no locator matches
+        """
+        found = self._lookup(name, False, params)
+        if not found:
+            raise NoSuchElementException(f"{name} not found")
+        return found[0]
+
+    def find_all(self, name: str, **params) -> list:
+        """
+        Finds every matching element without waiting, empty if none match
+        """
+        return self._lookup(name, True, params)
+
+    def wait(self, name: str, **params):
+        """
+        Waits until an element is present, e.g. while the page loads
+
+        Returns
+        -------
+        WebElement
+            first matching element
+        """
+        return self._wait_for(name, False, params)[0]
+
+    def wait_all(self, name: str, **params) -> list:
+        """
+        Waits until at least one element is present
+
+        Returns
+        -------
+        list
+            every matching element
+        """
+        return self._wait_for(name, True, params)
+
+    def stats(self) -> list[dict]:
+        """
+        Returns
+        -------
+        list[dict]
+            lookups and misses per locator with the milliseconds of its
+            lookups, slowest first
+        """
+        rows = []
+        for key in sorted(set(self._hits) | set(self._misses)):
+            name, index = key
+            by, selector, parent = SELECTORS[name][index]
+            timing = self._hits.get(key, RunningStats())
+            rows.append(
+                {
+                    "selector": name,
+                    "locator": f"{by}: {selector}",
+                    "parent": parent,
+                    "hits": timing.count,
+                    "misses": self._misses.get(key, 0),
+                }
+                | (timing.summary("ms") if timing.count else {})
+            )
+        return sorted(rows, key=lambda row: row.get("ms mean", 0), reverse=True)
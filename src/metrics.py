@@ -0,0 +1,282 @@
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+STATUSES = ("done", "failed", "out_of_scope", "skipped")
+
+
+class CrawlMetrics:
+    """
+    Live progress of a crawl, kept by the main process
+    Worker processes and tabs report nothing themselves, the main process
+    already hands out every town and receives every result, so it updates
+    the metrics there at no extra cost
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._planned = 0
+        self._towns = dict.fromkeys(STATUSES, 0)
+        self._units = 0
+        self._retries = 0
+        self._worker_restarts = 0
+        self._limit = None
+        # link to worker currently scraping it
+        self._in_flight = {}
+        # worker to (link, time started), link is None while idle
+        self._workers = {}
+        self._worker_towns = {}
+
+    def plan(self, n_towns: int):
+        with self._lock:
+            self._started = time.perf_counter()
+            self._planned = n_towns
+
+    def start(self, worker, link: str):
+        """
+        Marks a town as handed to a worker
+        """
+        with self._lock:
+            self._in_flight[link] = worker
+            self._workers[worker] = (link, time.perf_counter())
+
+    def finish(self, link: str, status: str, units: int = 0):
+        """
+        Marks a town as finished, its worker becomes idle unless it was
+        handed another town meanwhile
+
+        Parameters
+        ----------
+        link : str
+            link to the town
+        status : str
+            done, failed, out_of_scope or skipped
+        units : int, optional
+            number of units kept, by default 0
+        """
+        with self._lock:
+            worker = self._in_flight.pop(link, None)
+            if worker is not None:
+                # a tab may have been handed its next town already
+                if self._workers.get(worker, (None,))[0] == link:
+                    self._workers[worker] = (None, time.perf_counter())
+                self._worker_towns[worker] = self._worker_towns.get(worker, 0) + 1
+            self._towns[status] += 1
+            self._units += units
+
+    def add_retries(self, n: int):
+        with self._lock:
+            self._retries += n
+
+    def set_limit(self, limit: int):
+        with self._lock:
+            self._limit = limit
+
+    def requeue(self, link: str):
+        """
+        Marks a town as back to pending, its worker becomes idle
+        """
+        with self._lock:
+            worker = self._in_flight.pop(link, None)
+            if self._workers.get(worker, (None,))[0] == link:
+                self._workers[worker] = (None, time.perf_counter())
+
+    def record_restart(self):
+        with self._lock:
+            self._worker_restarts += 1
+
+    def remove_worker(self, worker):
+        """
+        Forgets a worker that was killed, its town goes back to pending
+        """
+        with self._lock:
+            link, _ = self._workers.pop(worker, (None, None))
+            self._in_flight.pop(link, None)
+            self._worker_towns.pop(worker, None)
+        self.record_restart()
+
+    def snapshot(self) -> dict:
+        """
+        Returns
+        -------
+        dict
+            every metric, units per second and ETA from the average pace
+            since the crawl started
+        """
+        with self._lock:
+            now = time.perf_counter()
+            elapsed = now - self._started
+            finished = sum(self._towns.values())
+            remaining = max(self._planned - finished, 0)
+            scraped = self._towns["done"] + self._towns["failed"]
+            return {
+                "elapsed": elapsed,
+                "planned": self._planned,
+                "towns": dict(self._towns),
+                "in_flight": len(self._in_flight),
+                "units": self._units,
+                "units_per_second": self._units / elapsed if elapsed else 0,
+                "retries": self._retries,
+                "worker_restarts": self._worker_restarts,
+                "limit": self._limit,
+                "eta": elapsed / scraped * remaining if scraped else None,
+                "workers": {
+                    worker: {
+                        "busy": link is not None,
+                        "seconds": now - since,
+                        "towns": self._worker_towns.get(worker, 0),
+                    }
+                    for worker, (link, since) in self._workers.items()
+                },
+            }
+
+    def render(self) -> str:
+        """
+        Returns
+        -------
+        str
+            the metrics in the Prometheus text format
+        """
+        snapshot = self.snapshot()
+        workers = snapshot["workers"]
+        # name, type, help, [(labels, value)]
+        metrics = [
+            ("sbf_elapsed_seconds", "gauge", "Seconds since the crawl started",
+             [({}, round(snapshot["elapsed"], 3))]),
+            ("sbf_towns_planned", "gauge", "Towns to scrape in this run",
+             [({}, snapshot["planned"])]),
+            ("sbf_towns_total", "counter", "Towns finished by status",
+             [({"status": status}, n) for status, n in snapshot["towns"].items()]),
+            ("sbf_towns_in_flight", "gauge", "Towns being scraped",
+             [({}, snapshot["in_flight"])]),
+            ("sbf_units_total", "counter", "Units scraped",
+             [({}, snapshot["units"])]),
+            ("sbf_units_per_second", "gauge", "Units per second since the start",
+             [({}, round(snapshot["units_per_second"], 3))]),
+            ("sbf_retries_total", "counter", "Failed attempts",
+             [({}, snapshot["retries"])]),
+            ("sbf_worker_restarts_total", "counter", "Workers killed and replaced",
+             [({}, snapshot["worker_restarts"])]),
+            ("sbf_concurrency_limit", "gauge", "Towns allowed in flight",
+             [({}, snapshot["limit"])] if snapshot["limit"] is not None else []),
+            ("sbf_eta_seconds", "gauge", "Estimated seconds until every town is finished",
+             [({}, round(snapshot["eta"], 1))] if snapshot["eta"] is not None else []),
+            ("sbf_worker_busy", "gauge", "1 while the worker scrapes a town",
+             [({"worker": w}, int(s["busy"])) for w, s in workers.items()]),
+            ("sbf_worker_state_seconds", "gauge", "Seconds the worker is busy or idle for",
+             [({"worker": w}, round(s["seconds"], 3)) for w, s in workers.items()]),
+            ("sbf_worker_towns_total", "counter", "Towns finished by the worker",
+             [({"worker": w}, s["towns"]) for w, s in workers.items()]),
+        ]
+        lines = []
+        for name, kind, help_text, samples in metrics:
+            if not samples:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if labels else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsPublisher:
+    """
+    Publishes CrawlMetrics while a crawl runs, over a local HTTP endpoint
+    at /metrics for Prometheus to scrape, a textfile rewritten every
+    interval seconds, e.g. for the node_exporter textfile collector, or both
+    """
+
+    def __init__(
+        self,
+        metrics: CrawlMetrics,
+        port: int = None,
+        textfile: str = None,
+        host: str = "127.0.0.1",
+        interval: float = 5,
+    ):
+        """
+        Parameters
+        ----------
+        metrics : CrawlMetrics
+            metrics to publish
+        port : int, optional
+            port of the HTTP endpoint, by default no endpoint
+        textfile : str, optional
+            path of the textfile, by default no textfile
+        host : str, optional
+            address to listen on, by default 127.0.0.1
+        interval : float, optional
+            seconds between rewrites of the textfile, by default 5
+        """
+        self._metrics = metrics
+        self._textfile = textfile
+        self._interval = interval
+        self._stop = threading.Event()
+        self._threads = []
+        self._httpd = None
+        if port is not None:
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split("?")[0] != "/metrics":
+                        self.send_error(404)
+                        return
+                    body = metrics.render().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", CONTENT_TYPE)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    logging.debug(format, *args)
+
+            self._httpd = ThreadingHTTPServer((host, port), Handler)
+
+    def write_textfile(self):
+        # write then rename, so a collector never reads half a file
+        tmp = f"{self._textfile}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self._metrics.render())
+        os.replace(tmp, self._textfile)
+
+    def _rewrite(self):
+        while not self._stop.wait(self._interval):
+            self.write_textfile()
+
+    def start(self):
+        if self._httpd is not None:
+            host, port = self._httpd.server_address[:2]
+            logging.info("Metrics on http://%s:%d/metrics", host, port)
+            self._threads.append(
+                threading.Thread(target=self._httpd.serve_forever, daemon=True)
+            )
+        if self._textfile is not None:
+            self._threads.append(threading.Thread(target=self._rewrite, daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def close(self):
+        """
+        Stops publishing, the textfile keeps the final metrics
+        """
+        self._stop.set()
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+        for thread in self._threads:
+            thread.join()
+        if self._textfile is not None:
+            self.write_textfile()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
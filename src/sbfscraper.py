@@ -3,21 +3,31 @@ import time
 import re
 import datetime
 import logging
+import queue
+from collections import Counter, deque
+from itertools import count
+from multiprocessing import Process, Queue
+from typing import Iterator, Union
 from selenium import webdriver
-from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.support.wait import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.remote.remote_connection import RemoteConnection
 from selenium.webdriver.support.ui import Select
 from selenium.common.exceptions import (
     NoSuchElementException,
     ElementClickInterceptedException,
 )
+from urllib3.exceptions import HTTPError
 from webdriver_manager.chrome import ChromeDriverManager
-from xlsxwriter import Workbook
-from xlsxwriter.utility import xl_rowcol_to_cell
-import win32com.client as win32
 from tqdm import tqdm
+from .capture import CaptureArchive
+from .concurrency import AIMDController
+from .export import autofit_columns, export_towns
+from .locators import LocatorRegistry
+from .metrics import CrawlMetrics, MetricsPublisher
+from .schedule import CrawlHistory
+from .scope import CrawlScope
+from .shard import export_shards, merge_shards
+from .watchdog import kill_driver, kill_tree
 
 
 class SBFScraper:
@@ -33,7 +43,27 @@ class SBFScraper:
     8. Price and sqm
     """
 
-    def __init__(self, filename: str = None, headless: bool = False):
+    MODES = ("serial", "tabs", "process")
+
+    def __init__(
+        self,
+        filename: str = None,
+        headless: bool = False,
+        mode: str = "serial",
+        n_workers: int = 4,
+        adaptive: bool = False,
+        page_load_timeout: int = 60,
+        town_timeout: int = 600,
+        capture: str = None,
+        time_budget: float = None,
+        scope: CrawlScope = None,
+        shard_by: str = None,
+        shard_format: str = "xlsx",
+        export_workers: int = None,
+        merge: bool = False,
+        metrics_port: int = None,
+        metrics_file: str = None,
+    ):
         """
         Initialize the SBFScraper class
 
@@ -43,7 +73,54 @@ class SBFScraper:
             Path of excel file to save the scraped data
         headless : bool, optional
             _description_, by default False
+        mode : str, optional
+            how towns are scraped concurrently, by default "serial"
+            serial: one town at a time in the main browser
+            tabs: n_workers tabs in a single extra Chrome instance
+            process: n_workers processes, each with its own Chrome instance
+        n_workers : int, optional
+            number of tabs or processes, by default 4
+        adaptive : bool, optional
+            adjust the number of active tabs or processes to the site's
+            latency and failures, n_workers becomes the maximum,
+            by default False
+        page_load_timeout : int, optional
+            seconds before a page load or script is abandoned, a WebDriver
+            call that gets no answer for 30 seconds longer restarts the
+            driver, by default 60
+        town_timeout : int, optional
+            seconds a single town may take including retries, a worker
+            process that exceeds it is killed and replaced, by default 600
+        capture : str, optional
+            directory of a CaptureArchive to record the page texts in,
+            the run is named after the excel file, by default None
+        time_budget : float, optional
+            seconds the crawl may take, towns are scraped most valuable
+            first and towns that no longer fit are skipped and preferred
+            next time, by default no limit
+        scope : CrawlScope, optional
+            towns, flat types and price and level ranges to collect, out
+            of scope towns and flat types are not opened at all,
+            by default everything
+        shard_by : str, optional
+            town or flat_type, write one file per shard in parallel
+            processes into a directory named after the excel file,
+            by default a single excel file
+        shard_format : str, optional
+            xlsx or csv parts, by default "xlsx"
+        export_workers : int, optional
+            processes writing the shards, by default the number of cores
+        merge : bool, optional
+            merge the shards into a single file afterwards, by default False
+        metrics_port : int, optional
+            serve live crawl metrics in the Prometheus text format on
+            http://127.0.0.1:<port>/metrics, by default None
+        metrics_file : str, optional
+            rewrite the same metrics into this file every few seconds,
+            by default None
         """
+        if mode not in self.MODES:
+            raise ValueError(f"mode must be one of {self.MODES}, got {mode}")
         if not filename:
             self._filename = os.path.abspath(
                 f"SBF_Scraped_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
@@ -55,23 +132,96 @@ class SBFScraper:
             )
         self._filename = os.path.join("outputs", self._filename)
         os.makedirs("outputs", exist_ok=True)
+        self._scope = scope or CrawlScope()
+        self._archive = (
+            CaptureArchive(
+                capture,
+                os.path.splitext(os.path.basename(self._filename))[0],
+                scope=self._scope.to_dict(),
+            )
+            if capture
+            else None
+        )
+        self._captured_town = ""
+        self._captured_blocks = []
         self._headless = headless
-        self._service = ChromeService(ChromeDriverManager().install())
-        self._driver = webdriver.Chrome(service=self._service)
+        self._mode = mode
+        self._n_workers = n_workers
+        self._controller = AIMDController(n_workers) if adaptive else None
+        self._history = CrawlHistory()
+        self._time_budget = time_budget
+        self._deadline = None
+        self._skipped_links = []
+        self._shard_by = shard_by
+        self._shard_format = shard_format
+        self._export_workers = export_workers
+        self._merge = merge
+        self._metrics = CrawlMetrics()
+        self._metrics_port = metrics_port
+        self._metrics_file = metrics_file
+        self._out_of_scope = 0
+        # units on the page before the price and level ranges are applied
+        self._units_seen = 0
+        self._blocks_read = 0
+        # seconds per block of the last scraped town, the concurrency signal
+        self._block_latency = None
+        self._errors = 0
+        self._locators = LocatorRegistry()
+        self._page_load_timeout = page_load_timeout
+        self._town_timeout = town_timeout
+        self._page_load_strategy = "normal"
+        self._driver_path = ChromeDriverManager().install()
+        RemoteConnection.set_timeout(page_load_timeout + 30)
+        self._use_driver(
+            webdriver.Chrome(service=ChromeService(self._driver_path))
+        )
         self._driver.maximize_window()
-        self._wait = WebDriverWait(self._driver, 10)
         self._driver.get("https://homes.hdb.gov.sg/home/finding-a-flat")
         # self._driver.maximize_window()
         self._initial_units = self.get_sbf_units_n_click()
         self._faulty_links = []
 
-    def generate_headless_driver(self):
+    def __getstate__(self):
+        # drivers cannot be sent to worker processes, each worker starts its own
+        state = self.__dict__.copy()
+        state.pop("_driver", None)
+        # workers report through the result queue, the main process keeps the metrics
+        state.pop("_metrics", None)
+        return state
+
+    def _use_driver(self, driver):
+        """
+        Points every scraping method at the given driver
+        """
+        self._driver = driver
+        self._locators.use(driver)
+        driver.set_page_load_timeout(self._page_load_timeout)
+        driver.set_script_timeout(self._page_load_timeout)
+
+    def _restart_driver(self):
+        """
+        Replaces a driver that stopped answering with a new headless one
+        """
+        kill_driver(self._driver)
+        self._use_driver(self.generate_headless_driver(self._page_load_strategy))
+
+    def generate_headless_driver(self, page_load_strategy: str = "normal"):
         """
         This function generates a headless driver
+
+        Parameters
+        ----------
+        page_load_strategy : str, optional
+            "none" returns from driver.get immediately, by default "normal"
         """
         options = webdriver.ChromeOptions()
         options.add_argument("start-minimized")
-        return webdriver.Chrome(service=self._service, options=options)
+        options.page_load_strategy = page_load_strategy
+        # class level, so set again in every worker process
+        RemoteConnection.set_timeout(self._page_load_timeout + 30)
+        return webdriver.Chrome(
+            service=ChromeService(self._driver_path), options=options
+        )
 
     def get_sbf_units_n_click(self) -> int:
         """
@@ -82,11 +232,7 @@ class SBFScraper:
         int
             Number of units
         """
-        test = self._wait_elements(
-            By.XPATH,
-            "/html/body/app-root/div[2]/app-find-my-flat/section/div/"
-            "app-search-results/div/div/div[4]/app-flat-cards-categories",
-        )
+        test = self._locators.wait_all("sbf_categories")
         for element in test:
             split = element.text.split(sep="\n")
             if split[0] == "SBF":
@@ -103,13 +249,32 @@ class SBFScraper:
         dict
             Dictionary of town details
         """
-        town_details = self._wait_element(By.XPATH,"/html/body/app-root/div[2]/app-sbf-details/section/div/div[3]/div[1]/div/div/div/div[2]/div").text.split(sep='\n')
+        town_text = self._locators.wait("town_details").text
+        self._captured_town = town_text
+        return self.parse_town_details(town_text)
+
+    @classmethod
+    def parse_town_details(cls, town_text: str) -> dict:
+        """
+        Parses the town details text of a page
+
+        Parameters
+        ----------
+        town_text : str
+            text of the town details section
+
+        Returns
+        -------
+        dict
+            Dictionary of town details
+        """
+        town_details = town_text.split(sep='\n')
 
         town_dict = dict(zip(town_details[::2],town_details[1::2]))
-        town_dict['Remaining Lease'] = self.parse_lease(town_dict['Remaining Lease'])
+        town_dict['Remaining Lease'] = cls.parse_lease(town_dict['Remaining Lease'])
         town_dict['Est months'] = ''
         if 'available' not in town_dict['Probable Completion Date'].lower():
-            town_dict['Probable Completion Date']= self.parse_dates(town_dict['Probable Completion Date'])
+            town_dict['Probable Completion Date']= cls.parse_dates(town_dict['Probable Completion Date'])
             town_dict['Keys Available'] = False
         else:
             town_dict['Probable Completion Date'] = ''
@@ -117,7 +282,7 @@ class SBFScraper:
 
         return town_dict
 
-    def scroll_blocks(self, flat_type_dict: dict) -> list:
+    def scroll_blocks(self, flat_type_dict: dict) -> Iterator[dict]:
         """
         This function scrolls through the blocks
         Then appends the block number to the flat_type_dict
@@ -127,70 +292,74 @@ class SBFScraper:
         flat_type_dict : dict
             Dictionary of flat type details
 
-        Returns
-        -------
-        list
-            List of dictionaries of flat type details
+        Yields
+        ------
+        dict
+            flat type details of a single unit
         """
-        block_no_selector = Select(
-            self._wait_element(
-                By.XPATH, "//*[@id='layout-block']/div[2]/div/div/div[3]/select"
-            )
-        )
+        block_no_selector = Select(self._locators.wait("block_select"))
         value = 0
-        flat_block_LD = []
         while True:
             try:
                 block_no_selector.select_by_value(str(value))
-                block_no_string = self._driver.find_element(
-                    By.XPATH,
-                    f"//*[@id='layout-block']/div[2]/"
-                    f"div/div/div[3]/select/option[{value + 2}]",
-                ).text
+                block_no_string = self._locators.find("block_option", n=value + 2).text
                 block_dict = {"Block": block_no_string}
-                ethnics_dict = self.get_ethnics()
+                ethnic_text, grid_text = self._ethnic_text(), self._grid_text()
+                if self._archive is not None:
+                    self._captured_blocks.append(
+                        (flat_type_dict["flat_type"], block_no_string, ethnic_text, grid_text)
+                    )
+                self._blocks_read += 1
+                ethnics_dict = self.parse_ethnics(ethnic_text)
+                units = list(self.parse_units(grid_text))
+                self._units_seen += len(units)
                 list_of_flats = [
                     flat_type_dict | block_dict | x | ethnics_dict
-                    for x in self.get_units()
+                    for x in units
+                    if self._scope.wants_unit(x)
                 ]
-                flat_block_LD.extend(list_of_flats)
                 value += 1
             except NoSuchElementException:
                 break
-        return flat_block_LD
+            yield from list_of_flats
 
     # loop to check room type
-    def scroll_flat_type(self, town_dict: dict) -> list[dict]:
+    def scroll_flat_type(self, town_dict: dict) -> Iterator[dict]:
         """
         This function scrolls through the flat types
         Inside the function it also runs the scroll blocks function, which
         scrolls through the blocks
         Example 2 room flexi, 3 room, 4 room, 5 room
+        Flat types out of scope are never selected
 
         Parameters
         ----------
         town_dict : dict
             Dictionary of town details
 
-        Returns
-        -------
-        list[dict]
-            list of dictionaries of flat type details per town
+        Yields
+        ------
+        dict
+            flat type details of a single unit
         """
-        flat_type_selector = Select(self._wait_element(By.XPATH,"//*[@id='layout-block']/div[2]/div/div/div[1]/select"))
-        value = 0
-        final_flat_block_LD = []
-        while True:
+        flat_type_selector = Select(self._locators.wait("flat_type_select"))
+        # the first option is the placeholder, no lookup past the last one
+        for value in range(len(flat_type_selector.options) - 1):
             try:
+                flat_type_string = self._locators.find("flat_type_option", n=value + 2).text
+                if not self._scope.wants_flat_type(flat_type_string):
+                    continue
                 flat_type_selector.select_by_value(str(value))
-                flat_type_string = self._driver.find_element(
-                    By.XPATH,f"//*[@id='layout-block']/div[2]/div/div/div[1]/select/option[{value+2}]").text
-                flat_type_dict = town_dict|{"flat_type": flat_type_string}
-                final_flat_block_LD.extend(self.scroll_blocks(flat_type_dict))
-                value+= 1
             except NoSuchElementException:
                 break
-        return final_flat_block_LD
+            flat_type_dict = town_dict|{"flat_type": flat_type_string}
+            yield from self.scroll_blocks(flat_type_dict)
+
+    def _ethnic_text(self) -> str:
+        return self._locators.find("ethnic_quota").text
+
+    def _grid_text(self) -> str:
+        return self._locators.find("unit_grid").text
 
     def get_ethnics(self) -> dict:
         """
@@ -201,31 +370,101 @@ class SBFScraper:
         dict
             dictionary of the ethnic quota
         """
-        ethnic = self._driver.find_element(
-            By.XPATH, "//*[@id='available-sidebar']/div[1]/div[2]"
-        ).text
+        return self.parse_ethnics(self._ethnic_text())
+
+    @staticmethod
+    def parse_ethnics(ethnic: str) -> dict:
+        """
+        Parses the ethnic quota text of the sidebar
+
+        Parameters
+        ----------
+        ethnic : str
+            text of the ethnic quota
+
+        Returns
+        -------
+        dict
+            dictionary of the ethnic quota
+        """
         ethnic = re.split(r"\n|:", ethnic)
         ethnic = dict(zip(ethnic[::2], ethnic[1::2]))
         return ethnic
 
-    def get_units(self) -> list:
+    def get_units(self) -> Iterator[dict]:
         """
         Gets the units for the block, this is the lowest level loop
 
-        Returns
-        -------
-        list
-            list of units
+        Yields
+        ------
+        dict
+            unit details
+        """
+        yield from self.parse_units(self._grid_text())
+
+    @classmethod
+    def parse_units(cls, all_blocks: str) -> Iterator[dict]:
+        """
+        Parses the text of the available units grid
+
+        Parameters
+        ----------
+        all_blocks : str
+            text of the grid
+
+        Yields
+        ------
+        dict
+            unit details
         """
-        all_blocks = self._driver.find_element(By.XPATH, "//*[@id='available-grid']").text
         flat_list = re.split("#", all_blocks)
-        flat_list = self.remove_null(flat_list)
-        list_of_flats = []
+        flat_list = cls.remove_null(flat_list)
         for floor_level in flat_list:
             floor_level = floor_level.split(sep="\n")
-            floor_level = self.remove_null(floor_level)
-            list_of_flats.extend(self.get_flats(floor_level))
-        return list_of_flats
+            floor_level = cls.remove_null(floor_level)
+            yield from cls.get_flats(floor_level)
+
+    @classmethod
+    def replay(cls, archive: CaptureArchive, run_id: str) -> Iterator[list[dict]]:
+        """
+        Parses a recorded run again without the website
+        Gives the same units as iter_units did for that run, the price and
+        level range of its scope are applied again
+
+        Parameters
+        ----------
+        archive : CaptureArchive
+            archive the run was recorded in
+        run_id : str
+            id of the run
+
+        Yields
+        ------
+        list[dict]
+            units of a single town
+        """
+        scope = CrawlScope(**archive.scope(run_id))
+        link, dict_by_town = None, []
+        town_dicts = {}
+        for block in archive.replay(run_id):
+            if block["link"] != link:
+                if dict_by_town:
+                    yield dict_by_town
+                link, dict_by_town = block["link"], []
+            if block["town"] not in town_dicts:
+                town_dicts[block["town"]] = cls.parse_town_details(block["town"])
+            flat_type_dict = town_dicts[block["town"]] | {
+                "flat_type": block["flat_type"]
+            }
+            block_dict = {"Block": block["block"]}
+            ethnics_dict = cls.parse_ethnics(block["ethnic"])
+            dict_by_town.extend(
+                flat_type_dict | block_dict | x | ethnics_dict | {"Link": link}
+                for x in cls.parse_units(block["grid"])
+                if scope.wants_unit(x)
+            )
+        if dict_by_town:
+            yield dict_by_town
 
     def get_total_units(self) -> int:
         """
@@ -236,10 +475,7 @@ class SBFScraper:
         int
             _description_
         """
-        return int(self._wait_element(
-            By.XPATH,
-            "/html/body/app-root/div[2]/app-sbf-details/section/div/div[3]/div[1]/div/div/div/div[3]/table",
-        ).text.split(sep=" ")[-1])
+        return int(self._locators.wait("total_units").text.split(sep=" ")[-1])
 
     @staticmethod
     def get_flats(floor_level_list) -> list:
@@ -332,126 +568,519 @@ class SBFScraper:
         """
         return int(re.findall("\d+", lease)[-1])
 
-    def _wait_elements(self, by, selector):
-        return self._wait.until(EC.presence_of_all_elements_located((by, selector)))
-
-    def _wait_element(self, by, selector):
-        return self._wait.until(EC.presence_of_element_located((by, selector)))
-
-    def run(self):
+    def get_links(self) -> list[str]:
         """
-        Main run function
+        Gets the list of all towns, cached in towns.txt
+
+        Returns
+        -------
+        list[str]
+            list of links to every town
         """
-        # 1. Get list of all towns
         # Select 50 towns per page for faster checking
         if os.path.exists("towns.txt"):
             with open("towns.txt", "r",encoding= 'utf-8') as f:
-                list_of_links = f.readlines()
-        else:
-            sel = Select(
-                self._wait_element(
-                    By.XPATH,
-                    "/html/body/app-root/div[2]/app-find-my-flat/section/div/"
-                    "app-search-results/div/div/div[3]/div/div[1]/div[1]"
-                    "/div[2]/select",
-                )
-            )
-            sel.select_by_value("50")
-            logging.info("Getting list of towns...")
+                return f.read().splitlines()
+        sel = Select(self._locators.wait("page_size_select"))
+        sel.select_by_value("50")
+        logging.info("Getting list of towns...")
+        time.sleep(1)
+        list_of_links = []
+        while True:
+            for div in self._locators.wait_all("town_links"):
+                list_of_links.append(div.get_attribute("href"))
+            try:
+                self._locators.wait("next_page").click()
+            # if not clickable then break, meaning end of pages
+            except ElementClickInterceptedException:
+                break
             time.sleep(1)
-            list_of_links = []
+        with open("towns.txt", "w",encoding= 'utf-8') as f:
+            f.write("\n".join(list_of_links))
+        return list_of_links
+
+    def scrape_town(
+        self, link: str, retries: int = 5, prefetched: bool = False
+    ) -> Union[list[dict], str]:
+        """
+        Scrapes every unit of a single town
+        A town is only returned once the number of units matches the page,
+        so a failed attempt never leaks partial rows. No new attempt is
+        started once the town took longer than town_timeout. A town out
+        of scope is left as soon as its name is read.
+
+        Parameters
+        ----------
+        link : str
+            link to the town
+        retries : int, optional
+            number of attempts, by default 5
+        prefetched : bool, optional
+            the current tab is already loading the link, by default False
+
+        Returns
+        -------
+        list[dict] | str
+            list of units, empty if every attempt failed, the town name if
+            nothing of the town is in scope, so the caller can remember it
+            even when this runs in a worker process
+        """
+        deadline = time.perf_counter() + self._town_timeout
+        self._block_latency = None
+        for attempt in range(retries):
+            if time.perf_counter() > deadline:
+                logging.info("Deadline passed at %s", link)
+                break
+            self._captured_blocks = []
+            self._units_seen = 0
+            self._blocks_read = 0
+            # another tab or a reload, the cached parent elements are gone
+            self._locators.reset()
+            try:
+                if attempt or not prefetched:
+                    self._driver.get(link)
+                town_dict = self.get_town_details()
+                if not self._scope.wants_town(town_dict.get("Town")):
+                    return town_dict.get("Town") or ""
+                # timed after the page is shown, so prefetched tabs are comparable
+                tic = time.perf_counter()
+                flat_details = list(self.scroll_flat_type(town_dict))
+                if self._blocks_read:
+                    self._block_latency = (time.perf_counter() - tic) / self._blocks_read
+                # skipped flat types are not counted, so only full towns can be checked
+                if not self._scope.filters_flat_types:
+                    assert self._units_seen == self.get_total_units(), "Wrong number of units"
+                if self._archive is not None:
+                    self._archive.record(link, self._captured_town, self._captured_blocks)
+                if not flat_details and not self._scope.is_empty:
+                    return town_dict.get("Town") or ""
+                return [x | {"Link": link} for x in flat_details]
+            except HTTPError as error:
+                # chromedriver did not answer in time, it cannot be trusted anymore
+                logging.error(error)
+                logging.info("Driver hung at %s, restarting", link)
+                self._errors += 1
+                self._restart_driver()
+            except Exception as error:
+                logging.error(error)
+                logging.info("Error at %s", link)
+                self._errors += 1
+                time.sleep(attempt*10)
+        return []
+
+    def log_selector_stats(self):
+        """
+        Logs the lookup time of every selector used so far, slowest first
+        """
+        for row in self._locators.stats():
+            logging.info("Selector %s", row)
+
+    def _limit(self) -> int:
+        """
+        Number of towns that may be scraped at the same time
+        """
+        return self._controller.limit if self._controller else self._n_workers
+
+    def _record(self, link: str, seconds: float, errors: int, block_latency: float):
+        """
+        Records a finished town
+
+        Parameters
+        ----------
+        link : str
+            link to the town
+        seconds : float
+            seconds from starting to load the town until it was read
+        errors : int
+            failed attempts
+        block_latency : float
+            seconds per block, None if no block was read
+        """
+        self._history.record_cost(link, seconds)
+        self._metrics.add_retries(errors)
+        if self._controller:
+            self._controller.record(block_latency, errors)
+            self._metrics.set_limit(self._controller.limit)
+
+    def _take(self, pending: deque):
+        """
+        Takes the next link to start from pending
+        With a time budget, towns whose estimated cost no longer fits in
+        the remaining time are skipped
+
+        Returns
+        -------
+        str
+            link, None if nothing is left to start
+        """
+        while pending:
+            link = pending.popleft()
+            if self._deadline is None or (
+                self._history.cost(link) <= self._deadline - time.perf_counter()
+            ):
+                return link
+            self._skipped_links.append(link)
+            self._metrics.finish(link, "skipped")
+        return None
+
+    def serial_run(self, list_of_links: list[str]) -> Iterator[tuple]:
+        """
+        Scrapes the towns one after another in the main browser
+
+        Yields
+        ------
+        tuple
+            link and its list of units
+        """
+        pending = deque(list_of_links)
+        while (link := self._take(pending)) is not None:
+            self._metrics.start(0, link)
+            time.sleep(1)
+            errors, tic = self._errors, time.perf_counter()
+            dict_by_town = self.scrape_town(link)
+            self._record(
+                link, time.perf_counter() - tic, self._errors - errors, self._block_latency
+            )
+            yield link, dict_by_town
+
+    def tab_run(self, list_of_links: list[str]) -> Iterator[tuple]:
+        """
+        Scrapes the towns over several tabs of a single Chrome instance
+        Pages are loaded without blocking, so the next towns load in the
+        background tabs while the current tab is being read
+
+        Yields
+        ------
+        tuple
+            link and its list of units
+        """
+        main_driver = self._driver
+        self._page_load_strategy = "none"
+        self._use_driver(self.generate_headless_driver(self._page_load_strategy))
+        pending = deque(list_of_links)
+        # tab handle to link, in the order the tabs started loading
+        loading = {}
+        # link to the time its tab started loading
+        started = {}
+        handles = []
+
+        def open_tabs():
+            handles[:] = [self._driver.current_window_handle]
+            for _ in range(self._n_workers - 1):
+                self._driver.switch_to.new_window("tab")
+                handles.append(self._driver.current_window_handle)
+
+        def fill():
+            # start loading towns in idle tabs, up to the current limit
+            for handle in handles:
+                if len(loading) >= self._limit():
+                    break
+                if handle not in loading:
+                    link = self._take(pending)
+                    if link is None:
+                        break
+                    self._driver.switch_to.window(handle)
+                    loading[handle] = link
+                    started[link] = time.perf_counter()
+                    self._metrics.start(handles.index(handle), link)
+                    self._driver.get(link)
+
+        try:
+            open_tabs()
+            fill()
+            while loading:
+                handle = next(iter(loading))
+                self._driver.switch_to.window(handle)
+                link = loading.pop(handle)
+                driver = self._driver
+                errors = self._errors
+                dict_by_town = self.scrape_town(link, prefetched=True)
+                # counted from the start of the background load, like the other modes
+                self._record(
+                    link,
+                    time.perf_counter() - started.pop(link),
+                    self._errors - errors,
+                    self._block_latency,
+                )
+                if self._driver is not driver:
+                    # the driver was restarted, the towns in the other tabs are lost
+                    pending.extendleft(reversed(loading.values()))
+                    for lost in loading.values():
+                        self._metrics.requeue(lost)
+                    self._metrics.record_restart()
+                    loading.clear()
+                    open_tabs()
+                # start the next towns before handing back this one
+                fill()
+                yield link, dict_by_town
+        finally:
+            self._driver.quit()
+            self._page_load_strategy = "normal"
+            self._use_driver(main_driver)
+
+    def scrape_links(self, worker_id: int, link_queue, result_queue):
+        """
+        Worker process of multiprocess_run, scrapes links with its own
+        driver until it receives None
+
+        Parameters
+        ----------
+        worker_id : int
+            id of the worker, sent back with every result
+        link_queue : Queue
+            links handed to this worker by the main process
+        result_queue : Queue
+            (worker id, link, list of units, seconds, failed attempts,
+            seconds per block) per town, shared by all workers
+        """
+        self._use_driver(self.generate_headless_driver())
+        try:
             while True:
-                for div in self._wait_elements(By.CLASS_NAME, "flat-link"):
-                    list_of_links.append(div.get_attribute("href"))
-                try:
-                    self._wait_element(By.CSS_SELECTOR, "[aria-label=Next]").click()
-                # if not clickable then break, meaning end of pages
-                except ElementClickInterceptedException:
+                link = link_queue.get()
+                if link is None:
                     break
                 time.sleep(1)
-            with open("towns.txt", "w",encoding= 'utf-8') as f:
-                f.write("\n".join(list_of_links))
+                errors, tic = self._errors, time.perf_counter()
+                dict_by_town = self.scrape_town(link)
+                result_queue.put(
+                    (
+                        worker_id,
+                        link,
+                        dict_by_town,
+                        time.perf_counter() - tic,
+                        self._errors - errors,
+                        self._block_latency,
+                    )
+                )
+        finally:
+            self.log_selector_stats()
+            self._driver.quit()
+
+    def multiprocess_run(self, list_of_links: list[str]) -> Iterator[tuple]:
+        """
+        Scrapes the towns over several processes, one Chrome instance each
+        Links are handed out only up to the current limit, so idle workers
+        wait when the limit is lowered. Towns are yielded as soon as any
+        worker finishes them.
+
+        A worker that dies, or holds a town for longer than town_timeout,
+        is killed together with its Chrome and replaced, and the town is
+        put back on the queue once.
+
+        Yields
+        ------
+        tuple
+            link and its list of units
+        """
+        result_queue = Queue()
+        pending = deque(list_of_links)
+        worker_ids = count()
+        # worker id to (process, link queue)
+        workers = {}
+        # worker id to (link, time handed out)
+        assigned = {}
+        restarts = Counter()
+
+        def spawn():
+            worker_id = next(worker_ids)
+            link_queue = Queue()
+            process = Process(
+                target=self.scrape_links, args=(worker_id, link_queue, result_queue)
+            )
+            process.start()
+            workers[worker_id] = (process, link_queue)
+
+        for _ in range(self._n_workers):
+            spawn()
+
+        try:
+            while pending or assigned:
+                for worker_id in list(workers):
+                    if len(assigned) >= self._limit():
+                        break
+                    if worker_id not in assigned:
+                        link = self._take(pending)
+                        if link is None:
+                            break
+                        workers[worker_id][1].put(link)
+                        assigned[worker_id] = (link, time.perf_counter())
+                        self._metrics.start(worker_id, link)
+
+                for worker_id, (link, started) in list(assigned.items()):
+                    process = workers[worker_id][0]
+                    hung = time.perf_counter() - started > self._town_timeout
+                    if not hung and process.is_alive():
+                        continue
+                    logging.info(
+                        "Worker %d %s at %s, replacing it",
+                        worker_id,
+                        "hung" if hung else "died",
+                        link,
+                    )
+                    kill_tree(process.pid)
+                    process.join()
+                    del workers[worker_id], assigned[worker_id]
+                    self._metrics.remove_worker(worker_id)
+                    spawn()
+                    restarts[link] += 1
+                    if restarts[link] > 1:
+                        yield link, []
+                    else:
+                        pending.appendleft(link)
+
+                try:
+                    worker_id, link, dict_by_town, seconds, errors, block_latency = (
+                        result_queue.get(timeout=1)
+                    )
+                except queue.Empty:
+                    continue
+                # ignore results of workers that were already replaced
+                if assigned.get(worker_id, (None,))[0] != link:
+                    continue
+                del assigned[worker_id]
+                self._record(link, seconds, errors, block_latency)
+                yield link, dict_by_town
+        finally:
+            for process, link_queue in workers.values():
+                link_queue.put(None)
+            for process, _ in workers.values():
+                process.join(timeout=30)
+                if process.is_alive():
+                    kill_tree(process.pid)
+
+    def iter_units(self, list_of_links: list[str] = None) -> Iterator[list[dict]]:
+        """
+        Scrapes the towns using the configured mode
+        Only finished towns are handed over, the caller decides what to keep.
+        Progress is published while the towns are scraped, if a metrics port
+        or file is set.
+
+        Parameters
+        ----------
+        list_of_links : list[str], optional
+            links to scrape, by default every town
 
+        Yields
+        ------
+        list[dict]
+            units of a single town
+        """
+        if list_of_links is None:
+            list_of_links = self.get_links()
         logging.info("Total number of towns: %s", len(list_of_links))
+        # towns whose name is known from earlier runs are not opened
+        in_scope = [
+            link
+            for link in list_of_links
+            if self._scope.wants_town(self._history.town(link))
+        ]
+        self._out_of_scope = len(list_of_links) - len(in_scope)
+        list_of_links = in_scope
+        if self._time_budget:
+            list_of_links = self._history.plan(list_of_links)
+            self._deadline = time.perf_counter() + self._time_budget
+        runners = {
+            "serial": self.serial_run,
+            "tabs": self.tab_run,
+            "process": self.multiprocess_run,
+        }
+        self._metrics.plan(len(list_of_links))
+        with MetricsPublisher(
+            self._metrics, port=self._metrics_port, textfile=self._metrics_file
+        ):
+            for link, dict_by_town in tqdm(
+                runners[self._mode](list_of_links), total=len(list_of_links)
+            ):
+                if isinstance(dict_by_town, str):
+                    # the town name, so the town is not opened next time if out of scope
+                    if dict_by_town:
+                        self._history.record_town(link, dict_by_town)
+                    self._out_of_scope += 1
+                    self._metrics.finish(link, "out_of_scope")
+                elif dict_by_town:
+                    if not self._scope.filters_units:
+                        self._history.record_result(link, dict_by_town)
+                    else:
+                        # a partial town would look like a changed town next time
+                        self._history.record_town(link, dict_by_town[0].get("Town"))
+                    self._metrics.finish(link, "done", len(dict_by_town))
+                    yield dict_by_town
+                else:
+                    self._faulty_links.append(link)
+                    self._metrics.finish(link, "failed")
+        if self._skipped_links:
+            logging.info(
+                "%d towns skipped to stay within the time budget",
+                len(self._skipped_links),
+            )
+            self._history.mark_skipped(self._skipped_links)
+        if self._out_of_scope:
+            logging.info("%d towns without units in scope", self._out_of_scope)
+        self._history.save()
+
+    def run(self):
+        """
+        Main run function
+        Towns are exported on a writer thread while the next town is scraped
+        """
         # Internal functions have their own loops
         # for loop by town, then by flat type, then by block, then by unit
         logging.info("Running through every town...")
-        final_list = []
         tic = time.perf_counter()
-        for link in tqdm(list_of_links):
-            time.sleep(1)
-            retries = 0
-            while retries < 5:
-                try:
-                    self._driver.get(link)
-                    flat_details = self.scroll_flat_type(self.get_town_details())
-                    assert len(flat_details) == self.get_total_units(), "Wrong number of units"
-                    dict_by_town = [x | {"Link": link} for x in flat_details]
-                    final_list.extend(dict_by_town)
-                    break
-                except Exception as error:
-                    logging.error(error)
-                    logging.info("Error at %s", link)
-                    self._faulty_links.append(link) if retries == 4 else None
-                    time.sleep(retries*10)
-                    retries += 1
+        if self._shard_by:
+            directory = os.path.splitext(self._filename)[0]
+            total = export_shards(
+                directory,
+                self.iter_units(),
+                by=self._shard_by,
+                fmt=self._shard_format,
+                n_workers=self._export_workers,
+            )["units"]
+            logging.info("Shards and manifest written to %s", directory)
+            if self._merge:
+                merged = f"{directory}.{self._shard_format}"
+                merge_shards(directory, merged)
+                logging.info("Shards merged into %s", merged)
+        else:
+            total = export_towns(self._filename, self.iter_units())
+        if self._archive is not None:
+            self._archive.close()
         logging.info(
             "%s flats found. Took %.2f seconds",
-            len(final_list),
+            total,
             time.perf_counter() - tic,
         )
-        if len(final_list) == self._initial_units:
+        if self._controller:
+            logging.info(
+                "Concurrency over time (seconds, limit): %s",
+                [(round(t, 1), limit) for t, limit in self._controller.history],
+            )
+        self.log_selector_stats()
+        if not self._scope.is_empty or self._skipped_links:
+            # the page total counts every town and unit, there is nothing to compare
+            logging.info(
+                "%d units scraped of %d on the site", total, self._initial_units
+            )
+        elif total == self._initial_units:
             print("Correct number of units found")
             logging.info("Correct number of units found")
         else:
             logging.info(
-                "Error: %d units missing", self._initial_units - len(final_list)
+                "Error: %d units missing", self._initial_units - total
             )
+        if self._faulty_links:
             with open("faulty_links.txt", "w", encoding='utf-8') as f:
                 f.write("\n".join(self._faulty_links))
             logging.info("Faulty links written to faulty_links.txt")
+        if self._skipped_links:
+            with open("skipped_links.txt", "w", encoding='utf-8') as f:
+                f.write("\n".join(self._skipped_links))
+            logging.info("Skipped links written to skipped_links.txt")
 
-        # 2. Close driver
+        # Close driver
         self._driver.quit()
 
-        # 3. Parse data into xlsx
-        logging.info("Parsing data into xlsx...")
-        wb = Workbook(self._filename)
-        ws = wb.add_worksheet("Raw Data")
-        ordered_list = list(final_list[0].keys())
-
-        first_row = 0
-        for header in ordered_list:
-            col = ordered_list.index(header)  # Keep order
-            ws.write(
-                first_row, col, header
-            )  # written first row which is the header of worksheet also.
-
-        date_format = wb.add_format({"num_format": "mm/dd/yyyy"})
-
-        row = 1
-        for details in final_list:
-            for _key, _value in details.items():
-                col = ordered_list.index(_key)
-                if _key.lower() == "est. completion date":
-                    ws.write(row, col, _value, date_format)
-                elif _key.lower() == "est months":
-                    cell = xl_rowcol_to_cell(row, col - 1)
-                    ws.write_formula(
-                        row=row,
-                        col=col,
-                        formula=f'=IFERROR(DATEDIF(TODAY(),{cell},"M"),0)',
-                    )
-                else:
-                    ws.write(row, col, _value)
-            row += 1  # enter the next row
-        wb.close()
-
         # Autofit columns
-        logging.info("Autofitting columns...")
-        excel = win32.gencache.EnsureDispatch("Excel.Application")
-        wb = excel.Workbooks.Open(self._filename)
-        ws = wb.Worksheets("Raw Data")
-        ws.Columns.AutoFit()
-        wb.Save()
-        excel.Application.Quit()
+        if os.path.exists(self._filename):
+            logging.info("Autofitting columns...")
+            autofit_columns(self._filename)
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import math
+import os
+import statistics
+import time
+
+
+class CrawlHistory:
+    """
+    Remembers per town how long it took, how many units it had, when it
+    last changed and whether it was skipped, so a crawl with a time
+    budget can start with the towns that matter most
+    """
+
+    def __init__(self, filename: str = "crawl_history.json"):
+        """
+        Parameters
+        ----------
+        filename : str, optional
+            path of the history file, by default "crawl_history.json"
+        """
+        self._filename = filename
+        self._towns = {}
+        if os.path.exists(filename):
+            with open(filename, "r", encoding="utf-8") as f:
+                self._towns = json.load(f)
+
+    def save(self):
+        with open(self._filename, "w", encoding="utf-8") as f:
+            json.dump(self._towns, f, indent=1)
+
+    def _town(self, link: str) -> dict:
+        return self._towns.setdefault(link, {})
+
+    def record_cost(self, link: str, seconds: float):
+        """
+        Updates the estimated cost of a town, a moving average so a
+        single slow run does not dominate
+
+        Parameters
+        ----------
+        link : str
+            link to the town
+        seconds : float
+            seconds taken to scrape the town
+        """
+        town = self._town(link)
+        previous = town.get("seconds")
+        town["seconds"] = seconds if previous is None else 0.7 * previous + 0.3 * seconds
+
+    def record_result(self, link: str, dict_by_town: list[dict]):
+        """
+        Records a scraped town, the town counts as changed when its units
+        or prices differ from the last time
+
+        Parameters
+        ----------
+        link : str
+            link to the town
+        dict_by_town : list[dict]
+            units of the town
+        """
+        now = time.time()
+        fingerprint = hashlib.sha1(
+            repr(sorted((x["Block"], x["unit"], x["price"]) for x in dict_by_town)).encode()
+        ).hexdigest()
+        town = self._town(link)
+        if town.get("fingerprint") != fingerprint:
+            town["fingerprint"] = fingerprint
+            town["changed"] = now
+        town["units"] = len(dict_by_town)
+        town["town"] = dict_by_town[0].get("Town")
+        town["scraped"] = now
+        town["skipped"] = 0
+
+    def record_town(self, link: str, name: str):
+        """
+        Records the name of a town that was opened but not scraped
+        """
+        self._town(link)["town"] = name
+
+    def town(self, link: str) -> str:
+        """
+        Name of a town, None if it was never opened
+        """
+        return self._towns.get(link, {}).get("town")
+
+    def mark_skipped(self, links: list[str]):
+        """
+        Records towns that did not fit in the time budget
+        """
+        for link in links:
+            town = self._town(link)
+            town["skipped"] = town.get("skipped", 0) + 1
+
+    def cost(self, link: str) -> float:
+        """
+        Estimated seconds to scrape a town, the median of all known
+        towns for towns that were never scraped
+        """
+        seconds = self._towns.get(link, {}).get("seconds")
+        if seconds is not None:
+            return seconds
+        known = [town["seconds"] for town in self._towns.values() if "seconds" in town]
+        return statistics.median(known) if known else 0
+
+    def value(self, link: str, now: float = None) -> float:
+        """
+        How much scraping a town is worth now
+        1. more units are worth more
+        2. towns not scraped for long are worth more, never scraped most
+        3. towns that changed in the last week are likely to change again
+        4. every time a town was skipped, it is worth more
+
+        Parameters
+        ----------
+        link : str
+            link to the town
+        now : float, optional
+            unix time, by default now
+
+        Returns
+        -------
+        float
+            value of the town, higher first
+        """
+        now = now or time.time()
+        town = self._towns.get(link, {})
+        if "scraped" not in town:
+            return math.inf
+        days_since_scraped = (now - town["scraped"]) / 86400
+        days_since_changed = (now - town.get("changed", 0)) / 86400
+        return (
+            math.log1p(town.get("units", 0))
+            + days_since_scraped
+            + (2 if days_since_changed < 7 else 0)
+            + 3 * town.get("skipped", 0)
+        )
+
+    def plan(self, links: list[str]) -> list[str]:
+        """
+        Orders the towns by value per estimated second, so a cut off
+        crawl has spent its time on the towns worth the most
+
+        Parameters
+        ----------
+        links : list[str]
+            links to every town
+
+        Returns
+        -------
+        list[str]
+            links, most valuable first
+        """
+        now = time.time()
+        return sorted(
+            links,
+            key=lambda link: self.value(link, now) / max(self.cost(link), 1),
+            reverse=True,
+        )
@@ -0,0 +1,116 @@
+class CrawlScope:
+    """
+    Which towns, flat types and units a crawl should collect
+    Names are compared case insensitive, bounds are inclusive.
+    An empty scope collects everything.
+    """
+
+    def __init__(
+        self,
+        towns: list[str] = None,
+        exclude_towns: list[str] = None,
+        flat_types: list[str] = None,
+        min_price: int = None,
+        max_price: int = None,
+        min_level: int = None,
+        max_level: int = None,
+    ):
+        """
+        Parameters
+        ----------
+        towns : list[str], optional
+            only these towns, by default every town
+        exclude_towns : list[str], optional
+            never these towns, by default None
+        flat_types : list[str], optional
+            only these flat types, e.g. ["4-Room", "5-Room"], by default all
+        min_price, max_price : int, optional
+            price range of the units, by default unbounded
+        min_level, max_level : int, optional
+            floor level range of the units, by default unbounded
+        """
+        self.towns = self._normalise(towns)
+        self.exclude_towns = self._normalise(exclude_towns) or set()
+        self.flat_types = self._normalise(flat_types)
+        self._ranges = [
+            (column, low, high)
+            for column, low, high in (
+                ("price", min_price, max_price),
+                ("level", min_level, max_level),
+            )
+            if low is not None or high is not None
+        ]
+
+    @staticmethod
+    def _normalise(names: list[str]) -> set:
+        return {name.strip().lower() for name in names} if names else None
+
+    def to_dict(self) -> dict:
+        """
+        Returns
+        -------
+        dict
+            arguments that recreate the scope, e.g. to store it with a run
+        """
+        ranges = {}
+        for column, low, high in self._ranges:
+            ranges[f"min_{column}"], ranges[f"max_{column}"] = low, high
+        return {
+            "towns": sorted(self.towns) if self.towns else None,
+            "exclude_towns": sorted(self.exclude_towns),
+            "flat_types": sorted(self.flat_types) if self.flat_types else None,
+        } | ranges
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.towns or self.exclude_towns or self.flat_types or self._ranges)
+
+    @property
+    def filters_flat_types(self) -> bool:
+        return self.flat_types is not None
+
+    @property
+    def filters_units(self) -> bool:
+        # False if every town in scope is collected whole
+        return self.filters_flat_types or bool(self._ranges)
+
+    def wants_town(self, town: str) -> bool:
+        """
+        Parameters
+        ----------
+        town : str
+            town name, None if not known yet
+
+        Returns
+        -------
+        bool
+            False only if the town is known to be out of scope
+        """
+        if town is None:
+            return True
+        town = town.strip().lower()
+        if town in self.exclude_towns:
+            return False
+        return self.towns is None or town in self.towns
+
+    def wants_flat_type(self, flat_type: str) -> bool:
+        return self.flat_types is None or flat_type.strip().lower() in self.flat_types
+
+    def wants_unit(self, unit: dict) -> bool:
+        """
+        Parameters
+        ----------
+        unit : dict
+            unit details with level and price
+
+        Returns
+        -------
+        bool
+            True if the unit is within the price and level range
+        """
+        for column, low, high in self._ranges:
+            if low is not None and unit[column] < low:
+                return False
+            if high is not None and unit[column] > high:
+                return False
+        return True
@@ -0,0 +1,363 @@
+import bisect
+import glob
+import heapq
+import json
+import logging
+import math
+import os
+import threading
+from collections import defaultdict
+from itertools import islice
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+from .xlsx_reader import from_excel_date, iter_sheet_rows
+
+# query parameter to (column, bound), bounds are inclusive
+RANGES = {
+    "min_price": ("price", "min"),
+    "max_price": ("price", "max"),
+    "min_sqm": ("sqm", "min"),
+    "max_sqm": ("sqm", "max"),
+    "min_level": ("level", "min"),
+    "max_level": ("level", "max"),
+}
+
+
+def latest_output(directory: str = "outputs") -> str:
+    """
+    Returns
+    -------
+    str
+        newest scraped excel file in the directory, diff reports excluded
+    """
+    files = [
+        f
+        for f in glob.glob(os.path.join(directory, "*.xlsx"))
+        if not os.path.basename(f).startswith(("diff_", "~$"))
+    ]
+    return max(files, key=os.path.getmtime) if files else None
+
+
+class UnitStore:
+    """
+    Units of a single run held in memory with indexes for the filters
+    Every combination of town and flat type, either of them or none has
+    its units sorted by price, by sqm and by level, and per level sorted
+    by price. A query with a level range but no sqm range bisects the
+    price range on every level in range and merges them by price. Any
+    other query bisects every range and scans the price range, or the sqm
+    or level range if that is much narrower, checking the other ranges per
+    unit.
+    """
+
+    INDEXED = ("price", "sqm", "level")
+
+    def __init__(self, rows: list[dict]):
+        """
+        Parameters
+        ----------
+        rows : list[dict]
+            units, e.g. the Raw Data sheet
+        """
+        self.rows = rows
+        groups = defaultdict(list)
+        by_price = sorted(range(len(rows)), key=lambda i: rows[i]["price"])
+        # position of every unit in price order, to sort matches back
+        self._price_rank = [0] * len(rows)
+        for rank, i in enumerate(by_price):
+            self._price_rank[i] = rank
+        for i in by_price:
+            town = str(rows[i].get("Town", "")).lower()
+            flat_type = str(rows[i].get("flat_type", "")).lower()
+            for key in ((town, flat_type), (town, None), (None, flat_type), (None, None)):
+                groups[key].append(i)
+        # group to column to (ids, values) sorted by the column
+        self._index = {}
+        # group to (sorted levels, (ids, prices) sorted by price per level)
+        self._by_level = {}
+        for key, ids in groups.items():
+            self._index[key] = {"price": (ids, [rows[i]["price"] for i in ids])}
+            levels = defaultdict(lambda: ([], []))
+            for i in ids:
+                level_ids, prices = levels[rows[i]["level"]]
+                level_ids.append(i)
+                prices.append(rows[i]["price"])
+            order = sorted(levels)
+            self._by_level[key] = (order, [levels[level] for level in order])
+            for column in self.INDEXED[1:]:
+                by_column = sorted(ids, key=lambda i: rows[i][column])
+                self._index[key][column] = (
+                    by_column,
+                    [rows[i][column] for i in by_column],
+                )
+
+    @classmethod
+    def from_workbook(cls, filename: str) -> "UnitStore":
+        rows = []
+        for row in iter_sheet_rows(filename):
+            date = row.get("Probable Completion Date")
+            if isinstance(date, (int, float)):
+                row["Probable Completion Date"] = from_excel_date(date).date().isoformat()
+            rows.append(row)
+        return cls(rows)
+
+    def facets(self) -> dict:
+        """
+        Returns
+        -------
+        dict
+            towns and flat types with their number of units
+        """
+        return {
+            "towns": {
+                town: len(group["price"][0])
+                for (town, flat_type), group in self._index.items()
+                if town is not None and flat_type is None
+            },
+            "flat_types": {
+                flat_type: len(group["price"][0])
+                for (town, flat_type), group in self._index.items()
+                if town is None and flat_type is not None
+            },
+            "units": len(self.rows),
+        }
+
+    def query(
+        self,
+        town: str = None,
+        flat_type: str = None,
+        limit: int = 1000,
+        offset: int = 0,
+        **ranges,
+    ) -> dict:
+        """
+        Filters the units, cheapest first
+
+        Parameters
+        ----------
+        town : str, optional
+            town, case insensitive
+        flat_type : str, optional
+            flat type, case insensitive, e.g. 4-room
+        limit : int, optional
+            maximum number of units returned, by default 1000
+        offset : int, optional
+            number of matching units to skip, by default 0
+        **ranges
+            min_price, max_price, min_sqm, max_sqm, min_level, max_level
+
+        Returns
+        -------
+        dict
+            total number of matches and the requested page of units
+
+        Raises
+        ------
+        ValueError
+            if limit or offset is negative, or a minimum is above its maximum
+        """
+        if limit < 0 or offset < 0:
+            raise ValueError("limit and offset must not be negative")
+        for column in self.INDEXED:
+            low, high = ranges.get(f"min_{column}"), ranges.get(f"max_{column}")
+            if low is not None and high is not None and low > high:
+                raise ValueError(f"min_{column} must not be above max_{column}")
+        key = (
+            town.lower() if town is not None else None,
+            flat_type.lower() if flat_type is not None else None,
+        )
+        group = self._index.get(key)
+        if group is None:
+            return {"total": 0, "units": []}
+        bounds = {column: [-math.inf, math.inf] for column in self.INDEXED}
+        for name, (column, bound) in RANGES.items():
+            if name in ranges:
+                bounds[column][0 if bound == "min" else 1] = ranges[name]
+        if bounds["level"] != [-math.inf, math.inf] and bounds["sqm"] == [-math.inf, math.inf]:
+            return self._query_levels(key, bounds, limit, offset)
+        spans = {}
+        for column, (low, high) in bounds.items():
+            values = group[column][1]
+            spans[column] = (
+                bisect.bisect_left(values, low),
+                bisect.bisect_right(values, high),
+            )
+        # matches of another range have to be sorted by price afterwards,
+        # so it is only worth it if the range is much narrower
+        column = min(self.INDEXED, key=lambda c: spans[c][1] - spans[c][0])
+        if 4 * (spans[column][1] - spans[column][0]) > spans["price"][1] - spans["price"][0]:
+            column = "price"
+        lo, hi = spans[column]
+        ids = group[column][0]
+        checks = [
+            (other, *bounds[other])
+            for other in self.INDEXED
+            if other != column and bounds[other] != [-math.inf, math.inf]
+        ]
+        if column == "price" and not checks:
+            return {
+                "total": hi - lo,
+                "units": [self.rows[i] for i in ids[lo + offset : min(hi, lo + offset + limit)]],
+            }
+
+        rows = self.rows
+        matches = [
+            i
+            for i in ids[lo:hi]
+            if all(low <= rows[i][other] <= high for other, low, high in checks)
+        ]
+        if column != "price":
+            matches.sort(key=self._price_rank.__getitem__)
+        return {
+            "total": len(matches),
+            "units": [rows[i] for i in matches[offset : offset + limit]],
+        }
+
+
+    def _query_levels(self, key: tuple, bounds: dict, limit: int, offset: int) -> dict:
+        order, partitions = self._by_level[key]
+        low, high = bounds["price"]
+        slices, total = [], 0
+        for ids, prices in partitions[
+            bisect.bisect_left(order, bounds["level"][0]) : bisect.bisect_right(
+                order, bounds["level"][1]
+            )
+        ]:
+            lo, hi = bisect.bisect_left(prices, low), bisect.bisect_right(prices, high)
+            if lo < hi:
+                slices.append(map(ids.__getitem__, range(lo, hi)))
+                total += hi - lo
+        # only the requested page is taken from the merge
+        matches = heapq.merge(*slices, key=self._price_rank.__getitem__)
+        return {
+            "total": total,
+            "units": [self.rows[i] for i in islice(matches, offset, offset + limit)],
+        }
+
+
+class UnitServer:
+    """
+    Serves the latest scrape over a local HTTP JSON API
+
+    GET /units?town=&flat_type=&min_price=&max_price=&min_sqm=&max_sqm=
+        &min_level=&max_level=&limit=&offset=
+    GET /facets
+    GET /health
+
+    Units are returned cheapest first. Responses are cached per query, and the store is swapped for the
+    newest excel file in the outputs directory once a run finishes.
+    """
+
+    def __init__(
+        self,
+        directory: str = "outputs",
+        host: str = "127.0.0.1",
+        port: int = 8000,
+        reload_interval: float = 10,
+        cache_size: int = 1024,
+    ):
+        """
+        Parameters
+        ----------
+        directory : str, optional
+            directory of the scraped excel files, by default "outputs"
+        host : str, optional
+            address to listen on, by default 127.0.0.1
+        port : int, optional
+            port to listen on, by default 8000
+        reload_interval : float, optional
+            seconds between checks for a newer file, by default 10
+        cache_size : int, optional
+            number of cached responses, by default 1024
+        """
+        self._directory = directory
+        self._reload_interval = reload_interval
+        self._filename = None
+        self._mtime = None
+        self._store = UnitStore([])
+        # part of the cache key, so no response of an old store is served
+        self._version = 0
+        self._stop = threading.Event()
+        self._render = lru_cache(maxsize=cache_size)(self._render_uncached)
+        self.reload()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                status, body = server._render(server._version, url.path, url.query)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logging.debug(format, *args)
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+
+    def reload(self) -> bool:
+        """
+        Loads the newest excel file if it changed since the last load
+        A file that cannot be read yet, e.g. while it is being written,
+        is tried again at the next check
+
+        Returns
+        -------
+        bool
+            True if a new store was loaded
+        """
+        filename = latest_output(self._directory)
+        if filename is None:
+            return False
+        mtime = os.path.getmtime(filename)
+        if (filename, mtime) == (self._filename, self._mtime):
+            return False
+        try:
+            store = UnitStore.from_workbook(filename)
+        except Exception as error:
+            logging.info("Could not load %s yet: %s", filename, error)
+            return False
+        self._store, self._filename, self._mtime = store, filename, mtime
+        self._version += 1
+        self._render.cache_clear()
+        logging.info("Serving %d units from %s", len(store.rows), filename)
+        return True
+
+    def _watch(self):
+        while not self._stop.wait(self._reload_interval):
+            self.reload()
+
+    def _render_uncached(self, version: int, path: str, query: str) -> tuple:
+        store = self._store
+        if path == "/health":
+            return 200, json.dumps({"file": self._filename}).encode()
+        if path == "/facets":
+            return 200, json.dumps(store.facets()).encode()
+        if path != "/units":
+            return 404, json.dumps({"error": f"unknown path {path}"}).encode()
+        params = dict(parse_qsl(query))
+        try:
+            kwargs = {
+                name: float(value) if name in RANGES else value
+                for name, value in params.items()
+                if name in RANGES or name in ("town", "flat_type")
+            }
+            kwargs["limit"] = int(params.get("limit", 1000))
+            kwargs["offset"] = int(params.get("offset", 0))
+            result = store.query(**kwargs)
+        except ValueError as error:
+            return 400, json.dumps({"error": str(error)}).encode()
+        return 200, json.dumps(result, default=str).encode()
+
+    def serve_forever(self):
+        host, port = self._httpd.server_address[:2]
+        logging.info("Listening on http://%s:%d", host, port)
+        threading.Thread(target=self._watch, daemon=True).start()
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._stop.set()
+            self._httpd.server_close()
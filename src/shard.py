@@ -0,0 +1,228 @@
+import csv
+import datetime
+import json
+import os
+import re
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from .aggregate import Aggregator
+from .enrich import enrich
+from .export import XlsxExporter
+from .xlsx_reader import from_excel_date, iter_sheet_rows
+
+SHARD_KEYS = {"town": "Town", "flat_type": "flat_type"}
+FORMATS = ("xlsx", "csv")
+MANIFEST = "manifest.json"
+
+
+def shard_name(value) -> str:
+    """
+    File name safe version of a shard value, e.g. Ang Mo Kio -> Ang_Mo_Kio
+    """
+    return re.sub(r"[^\w-]+", "_", str(value)).strip("_") or "unknown"
+
+
+def write_part(path: str, fmt: str, rows: list[dict]) -> dict:
+    """
+    Writes a single part file, runs in an export worker process
+
+    Parameters
+    ----------
+    path : str
+        path of the part file
+    fmt : str
+        xlsx or csv
+    rows : list[dict]
+        rows of the part
+
+    Returns
+    -------
+    dict
+        path, number of rows and seconds taken
+    """
+    tic = time.perf_counter()
+    if fmt == "xlsx":
+        with XlsxExporter(path) as exporter:
+            exporter.write_rows(rows)
+    else:
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(
+                {
+                    key: value.date().isoformat()
+                    if isinstance(value, datetime.datetime)
+                    else value
+                    for key, value in row.items()
+                }
+                for row in rows
+            )
+    return {
+        "path": path,
+        "rows": len(rows),
+        "seconds": round(time.perf_counter() - tic, 3),
+    }
+
+
+def export_shards(
+    directory: str,
+    towns,
+    by: str = "town",
+    fmt: str = "xlsx",
+    n_workers: int = None,
+    part_rows: int = 50000,
+) -> dict:
+    """
+    Writes towns into one file per shard, in parallel worker processes
+    With shards by town every town is handed to a worker as soon as it
+    arrives. Other shards are buffered and handed over every part_rows
+    rows, and at the end. Rows are enriched and added to the summary in
+    this process, the summary tables are kept in the manifest.
+
+    Layout of the directory:
+
+    <shard>-000.xlsx    rows of a shard, more parts if it is large
+    manifest.json       shards, parts, row counts and summary tables
+
+    Parameters
+    ----------
+    directory : str
+        directory to write the parts and manifest to
+    towns : Iterable[list[dict]]
+        units per town, e.g. SBFScraper.iter_units()
+    by : str, optional
+        town or flat_type, by default "town"
+    fmt : str, optional
+        xlsx or csv, by default "xlsx"
+    n_workers : int, optional
+        number of writer processes, by default the number of cores
+    part_rows : int, optional
+        rows per part file of buffered shards, by default 50000
+
+    Returns
+    -------
+    dict
+        the manifest
+    """
+    if by not in SHARD_KEYS:
+        raise ValueError(f"by must be one of {tuple(SHARD_KEYS)}, got {by}")
+    if fmt not in FORMATS:
+        raise ValueError(f"fmt must be one of {FORMATS}, got {fmt}")
+    os.makedirs(directory, exist_ok=True)
+    n_workers = n_workers or os.cpu_count()
+    column = SHARD_KEYS[by]
+    aggregator = Aggregator()
+    # shard name to rows not handed to a worker yet
+    buffers = {}
+    parts = {}
+    futures = set()
+    done = []
+    tic = time.perf_counter()
+
+    with ProcessPoolExecutor(n_workers) as executor:
+
+        def submit(shard: str):
+            rows = buffers.pop(shard)
+            number = parts.setdefault(shard, 0)
+            parts[shard] += 1
+            path = os.path.join(directory, f"{shard}-{number:03d}.{fmt}")
+            future = executor.submit(write_part, path, fmt, rows)
+            future.shard = shard
+            futures.add(future)
+            # a few parts per worker in flight, the rest waits in this process
+            while len(futures) > 2 * n_workers:
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                collect(finished)
+
+        def collect(finished):
+            for future in finished:
+                futures.remove(future)
+                done.append({"shard": future.shard} | future.result())
+
+        for dict_by_town in towns:
+            enrich(dict_by_town)
+            aggregator.add_rows(dict_by_town)
+            touched = set()
+            for row in dict_by_town:
+                shard = shard_name(row.get(column, ""))
+                buffers.setdefault(shard, []).append(row)
+                touched.add(shard)
+            for shard in touched:
+                if by == "town" or len(buffers[shard]) >= part_rows:
+                    submit(shard)
+        for shard in list(buffers):
+            submit(shard)
+        collect(list(futures))
+
+    done.sort(key=lambda part: part["path"])
+    for part in done:
+        part["path"] = os.path.relpath(part["path"], directory)
+    manifest = {
+        "by": by,
+        "format": fmt,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "seconds": round(time.perf_counter() - tic, 3),
+        "units": sum(part["rows"] for part in done),
+        "parts": done,
+        "summary": aggregator.tables(),
+    }
+    with open(os.path.join(directory, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def merge_shards(directory: str, filename: str) -> int:
+    """
+    Merges the parts of a sharded export back into a single file of the
+    same format, in manifest order
+    An excel file gets the summary sheets, csv parts are concatenated as
+    they are and every summary table is written next to the file.
+
+    Parameters
+    ----------
+    directory : str
+        directory of the sharded export
+    filename : str
+        path of the merged file
+
+    Returns
+    -------
+    int
+        number of rows merged
+    """
+    with open(os.path.join(directory, MANIFEST), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    paths = [os.path.join(directory, part["path"]) for part in manifest["parts"]]
+    total = 0
+    if manifest["format"] == "xlsx":
+        with XlsxExporter(filename) as exporter:
+            for path in paths:
+                rows = list(iter_sheet_rows(path))
+                for row in rows:
+                    date = row.get("Probable Completion Date")
+                    if isinstance(date, (int, float)):
+                        row["Probable Completion Date"] = from_excel_date(date)
+                exporter.write_rows(rows)
+                total += len(rows)
+            for sheet_name, table in manifest["summary"].items():
+                exporter.write_table(sheet_name, table)
+        return total
+
+    with open(filename, "w", newline="", encoding="utf-8") as out:
+        for i, path in enumerate(paths):
+            with open(path, "r", newline="", encoding="utf-8") as f:
+                header = f.readline()
+                if i == 0:
+                    out.write(header)
+                shutil.copyfileobj(f, out)
+    total = manifest["units"]
+    stem = os.path.splitext(filename)[0]
+    for sheet_name, table in manifest["summary"].items():
+        if not table:
+            continue
+        with open(f"{stem} - {sheet_name}.csv", "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(table[0]))
+            writer.writeheader()
+            writer.writerows(table)
+    return total
@@ -0,0 +1,43 @@
+import logging
+import psutil
+
+
+def kill_tree(pid: int):
+    """
+    Kills a process and every process it started, e.g. a worker process
+    with its chromedriver and Chrome. Nothing is asked of the processes,
+    so this works even when they stopped responding.
+
+    Parameters
+    ----------
+    pid : int
+        process id of the root process
+    """
+    try:
+        root = psutil.Process(pid)
+        processes = root.children(recursive=True) + [root]
+    except psutil.NoSuchProcess:
+        return
+    for process in processes:
+        try:
+            process.kill()
+        except psutil.NoSuchProcess:
+            pass
+    psutil.wait_procs(processes, timeout=10)
+
+
+def kill_driver(driver):
+    """
+    Kills chromedriver and its Chrome instance without going through
+    the WebDriver protocol, used when the driver stopped answering
+
+    Parameters
+    ----------
+    driver : WebDriver
+        the hung driver
+    """
+    process = getattr(driver.service, "process", None)
+    if process is None:
+        return
+    logging.info("Killing chromedriver %d", process.pid)
+    kill_tree(process.pid)
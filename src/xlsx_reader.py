@@ -0,0 +1,184 @@
+import datetime
+import re
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from functools import lru_cache
+from html import unescape
+from xml.sax.saxutils import escape
+from typing import Iterator
+
+# day 0 of excel dates, as written by xlsxwriter
+EXCEL_EPOCH = datetime.datetime(1899, 12, 30)
+
+_REL_ID = re.compile(rb'<sheet [^>]*?name="([^"]*)"[^>]*?r:id="([^"]*)"')
+_TARGET = re.compile(rb'<Relationship [^>]*?Id="([^"]*)"[^>]*?Target="([^"]*)"')
+_SHARED = re.compile(rb"<si>(.*?)</si>", re.S)
+_ROW_END = b"</row>"
+_CELL = re.compile(rb'<c r="([A-Z]+)\d+"([^>]*?)(?:/>|>(.*?)</c>)', re.S)
+_TYPE = re.compile(rb't="(\w+)"')
+_VALUE = re.compile(rb"<v>(.*?)</v>", re.S)
+_TEXT = re.compile(rb"<t[^>]*>(.*?)</t>", re.S)
+
+
+def _text(xml: bytes) -> str:
+    return unescape(b"".join(_TEXT.findall(xml)).decode("utf-8"))
+
+
+def _cell_value(attrs: bytes, body: bytes, shared: list):
+    cell_type = _TYPE.search(attrs)
+    cell_type = cell_type.group(1) if cell_type else b"n"
+    if cell_type == b"inlineStr":
+        return _text(body)
+    value = _VALUE.search(body)
+    if value is None:
+        return ""
+    value = value.group(1)
+    if cell_type == b"s":
+        return shared[int(value)]
+    if cell_type == b"b":
+        return value == b"1"
+    if cell_type in (b"str", b"e"):
+        return unescape(value.decode("utf-8"))
+    number = float(value)
+    return int(number) if number.is_integer() else number
+
+
+@lru_cache(maxsize=None)
+def _cell_pattern(cols: tuple) -> re.Pattern:
+    # s comes before t in every writer following the schema order
+    return re.compile(
+        rb'<c r="(' + b"|".join(cols) + rb')(\d+)"(?: s="\d+")?(?: t="(\w+)")?[^>]*?'
+        rb"(?:/>|>(?:<f>[^<]*</f>)?(?:<v>([^<]*)</v>|<is><t[^>]*>([^<]*)</t></is>)?</c>)"
+    )
+
+
+def _parse_rows(data: bytes, wanted: dict, shared: list) -> list[dict]:
+    """
+    Every row in data, header to value of the wanted columns, "" for
+    empty cells
+    """
+    rows, row, row_number = [], None, None
+    for col, number, cell_type, value, text in _cell_pattern(tuple(wanted)).findall(data):
+        if number != row_number:
+            row, row_number = dict.fromkeys(wanted.values(), ""), number
+            rows.append(row)
+        # inlined instead of _cell_value, this loop runs for every cell
+        if cell_type == b"inlineStr" or cell_type in (b"str", b"e"):
+            value = (text or value).decode("utf-8")
+            value = unescape(value) if "&" in value else value
+        elif not value:
+            value = ""
+        elif cell_type == b"s":
+            value = shared[int(value)]
+        elif cell_type == b"b":
+            value = value == b"1"
+        else:
+            number_value = float(value)
+            value = int(number_value) if number_value.is_integer() else number_value
+        row[wanted[col]] = value
+    return rows
+
+
+# shared strings of the workbook read by a worker process
+_worker_shared = []
+
+
+def _init_worker(shared: list):
+    global _worker_shared
+    _worker_shared = shared
+
+
+def _parse_block(data: bytes, wanted: dict) -> list[dict]:
+    return _parse_rows(data, wanted, _worker_shared)
+
+
+def iter_sheet_rows(
+    filename: str, sheet: str = "Raw Data", columns: tuple = None, n_workers: int = 1
+) -> Iterator[dict]:
+    """
+    Streams rows of a worksheet straight from the xlsx file
+    The sheet xml is scanned in chunks, only the requested columns are
+    converted and no row is kept after it is yielded. With several workers
+    the chunks are converted in worker processes, a few chunks ahead of
+    the caller, and rows are still yielded in sheet order.
+
+    Parameters
+    ----------
+    filename : str
+        path of the excel file
+    sheet : str, optional
+        name of the worksheet, by default "Raw Data"
+    columns : tuple, optional
+        headers of the columns to read, by default every column
+    n_workers : int, optional
+        number of processes converting the chunks, by default 1, i.e. in
+        this process
+
+    Yields
+    ------
+    dict
+        header to value, numbers as int or float
+    """
+    with zipfile.ZipFile(filename) as archive:
+        sheet_ids = dict(_REL_ID.findall(archive.read("xl/workbook.xml")))
+        targets = dict(_TARGET.findall(archive.read("xl/_rels/workbook.xml.rels")))
+        rel_id = sheet_ids.get(escape(sheet).encode("utf-8"))
+        if rel_id is None:
+            raise KeyError(f"{filename} has no sheet {sheet}")
+        target = targets[rel_id].decode("utf-8")
+        path = target.lstrip("/") if target.startswith("/") else "xl/" + target
+
+        shared = []
+        if "xl/sharedStrings.xml" in archive.namelist():
+            shared = [_text(si) for si in _SHARED.findall(archive.read("xl/sharedStrings.xml"))]
+
+        with ExitStack() as stack:
+            f = stack.enter_context(archive.open(path))
+            executor = None
+            if n_workers > 1:
+                executor = stack.enter_context(
+                    ProcessPoolExecutor(n_workers, initializer=_init_worker, initargs=(shared,))
+                )
+            # converted chunks not yielded yet, in sheet order
+            futures = deque()
+            rest = b""
+            wanted = None
+            while True:
+                # larger chunks with workers, each one is pickled twice
+                chunk = f.read(1 << 22 if executor else 1 << 20)
+                data = rest + chunk
+                cut = data.rfind(_ROW_END) + len(_ROW_END) if chunk else len(data)
+                data, rest = data[:cut], data[cut:]
+                if wanted is None:
+                    end = data.find(_ROW_END)
+                    if end < 0:
+                        if not chunk:
+                            # no header row, e.g. a run that kept no unit
+                            return
+                        rest = data
+                        continue
+                    # header row, then only the wanted columns are matched
+                    wanted = {}
+                    for col, attrs, body in _CELL.findall(data[:end]):
+                        header = _cell_value(attrs, body, shared)
+                        if columns is None or header in columns:
+                            wanted[col] = header
+                    data = data[end:]
+                if executor is None:
+                    yield from _parse_rows(data, wanted, shared)
+                else:
+                    futures.append(executor.submit(_parse_block, data, wanted))
+                    # a few chunks per worker in flight, bounds the memory
+                    while futures and (not chunk or len(futures) > 2 * n_workers):
+                        yield from futures.popleft().result()
+                if not chunk:
+                    break
+
+
+def from_excel_date(serial: float) -> datetime.datetime:
+    """
+    Converts an excel date serial back into a datetime
+    """
+    return EXCEL_EPOCH + datetime.timedelta(days=serial)
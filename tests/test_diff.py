@@ -0,0 +1,49 @@
+from src.diff import diff_units, read_run
+from src.export import XlsxExporter, export_towns
+from src.xlsx_reader import iter_sheet_rows
+
+# more than the 65530 hyperlinks excel allows per sheet
+N_ROWS = 70000
+
+
+def write_run(filename: str):
+    with XlsxExporter(filename) as exporter:
+        exporter.write_rows(
+            {
+                "Town": "Tampines",
+                "Link": f"https://homes.hdb.gov.sg/home/sbf/{i // 1000}",
+                "flat_type": "4-Room",
+                "Block": str(100 + i % 50),
+                "level": i % 30 + 1,
+                "unit": f"#{i}",
+                "sqm": 90,
+                "price": 300000 + i,
+            }
+            for i in range(N_ROWS)
+        )
+
+
+def test_diff_of_a_run_against_itself_is_empty(tmp_path):
+    filename = str(tmp_path / "run.xlsx")
+    write_run(filename)
+
+    rows = list(read_run(filename))
+    assert len(rows) == N_ROWS
+    assert all(row["Link"] for row in rows)
+    assert list(diff_units(read_run(filename), read_run(filename))) == []
+
+
+def test_read_with_workers_gives_the_same_rows(tmp_path):
+    filename = str(tmp_path / "run.xlsx")
+    write_run(filename)
+
+    assert list(read_run(filename, n_workers=2)) == list(read_run(filename, n_workers=1))
+
+
+def test_run_without_units(tmp_path):
+    filename = str(tmp_path / "empty.xlsx")
+    assert export_towns(filename, []) == 0
+
+    assert list(iter_sheet_rows(filename)) == []
+    assert list(read_run(filename, n_workers=2)) == []
+    assert list(diff_units(read_run(filename), read_run(filename))) == []
@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+from src.serve import UnitStore
+
+TOWNS = ("Tampines", "Bedok", "Punggol")
+FLAT_TYPES = ("3-Room", "4-Room", "5-Room")
+
+
+@pytest.fixture(scope="module")
+def rows():
+    rng = random.Random(0)
+    return [
+        {
+            "Town": rng.choice(TOWNS),
+            "flat_type": rng.choice(FLAT_TYPES),
+            "unit": f"#{i}",
+            "sqm": rng.choice((67, 93, 110)),
+            "level": rng.randint(1, 30),
+            "price": rng.randint(200, 900) * 1000,
+        }
+        for i in range(3000)
+    ]
+
+
+@pytest.fixture(scope="module")
+def store(rows):
+    return UnitStore(rows)
+
+
+def brute_force(rows, town=None, flat_type=None, limit=1000, offset=0, **ranges):
+    matches = [
+        row
+        for row in sorted(rows, key=lambda row: row["price"])
+        if (town is None or row["Town"].lower() == town.lower())
+        and (flat_type is None or row["flat_type"].lower() == flat_type.lower())
+        and all(
+            ranges.get(f"min_{column}", row[column])
+            <= row[column]
+            <= ranges.get(f"max_{column}", row[column])
+            for column in UnitStore.INDEXED
+        )
+    ]
+    return {"total": len(matches), "units": matches[offset : offset + limit]}
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        {},
+        {"min_price": 400000, "max_price": 500000, "offset": 10, "limit": 20},
+        {"town": "bedok", "max_price": 600000},
+        {"max_price": 500000, "min_level": 5},
+        {"town": "Punggol", "flat_type": "4-room", "min_level": 10, "max_level": 12},
+        {"min_sqm": 90, "max_sqm": 100, "max_level": 20},
+        {"min_sqm": 110, "min_price": 800000, "offset": 5},
+        {"min_level": 31},
+        {"town": "Jurong"},
+    ],
+)
+def test_query_matches_brute_force(store, rows, query):
+    assert store.query(**query) == brute_force(rows, **query)
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        {"offset": -1},
+        {"limit": -1},
+        {"min_price": 500000, "max_price": 400000},
+        {"min_level": 10, "max_level": 5},
+        {"min_sqm": 100, "max_sqm": 90},
+    ],
+)
+def test_invalid_query(store, query):
+    with pytest.raises(ValueError):
+        store.query(**query)
+
+
+def test_empty_store():
+    assert UnitStore([]).query(max_price=500000, min_level=5) == {"total": 0, "units": []}